@@ -31,4 +31,4 @@ CREATE TABLE Appointments (
     Vname varchar(255) REFERENCES Vaccines,
     Time date,
     PRIMARY KEY (Id)
-);
\ No newline at end of file
+);
@@ -0,0 +1,12 @@
+-- counters for db/IdAllocator.py, which hands out appointment IDs in blocks
+CREATE TABLE Sequences (
+    Name varchar(255),
+    NextValue BIGINT,
+    PRIMARY KEY (Name)
+);
+
+-- widen Appointments.Id to 64 bits; the primary key was created without a name, so look it up first
+DECLARE @pk sysname = (SELECT name FROM sys.key_constraints WHERE type = 'PK' AND parent_object_id = OBJECT_ID('Appointments'));
+EXEC ('ALTER TABLE Appointments DROP CONSTRAINT ' + @pk);
+ALTER TABLE Appointments ALTER COLUMN Id BIGINT NOT NULL;
+ALTER TABLE Appointments ADD CONSTRAINT PK_Appointments PRIMARY KEY (Id);
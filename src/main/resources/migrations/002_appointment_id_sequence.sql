@@ -0,0 +1,7 @@
+-- counters for db/IdAllocator.py, which hands out appointment IDs in blocks
+-- (SQLite integers are already 64-bit, see the .mssql variant for widening Appointments.Id)
+CREATE TABLE Sequences (
+    Name varchar(255),
+    NextValue BIGINT,
+    PRIMARY KEY (Name)
+);
@@ -0,0 +1,3 @@
+-- a patient can have at most one appointment per day; also serves the per-day check in reserve
+-- and, with the included columns, show_appointments for patients
+CREATE UNIQUE INDEX IX_Appointments_Pusername_Time ON Appointments (Pusername, Time) INCLUDE (Cusername, Vname);
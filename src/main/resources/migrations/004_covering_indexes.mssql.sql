@@ -0,0 +1,8 @@
+-- availabilities of one caregiver (upload_availability, cancel); also the foreign key index to Caregivers
+CREATE INDEX IX_Availabilities_Username_Time ON Availabilities (Username, Time);
+
+-- appointments of one caregiver (show_appointments, cancel, upload_availability); also the foreign key index to Caregivers
+CREATE INDEX IX_Appointments_Cusername_Time ON Appointments (Cusername, Time) INCLUDE (Pusername, Vname);
+
+-- foreign key index to Vaccines
+CREATE INDEX IX_Appointments_Vname ON Appointments (Vname);
@@ -0,0 +1,8 @@
+-- optional dose counters of hot vaccines, spread over several rows so concurrent bookings lock different rows
+-- (see Vaccine.shard); a vaccine's doses are its Vaccines.Doses plus the sum of its shards
+CREATE TABLE VaccineShards (
+    Name varchar(255) REFERENCES Vaccines,
+    Shard int,
+    Doses int,
+    PRIMARY KEY (Name, Shard)
+);
@@ -0,0 +1,13 @@
+-- past appointments moved out of Appointments by db/Retention.py, so the hot table only holds the upcoming ones
+CREATE TABLE AppointmentsArchive (
+    Id BIGINT,
+    Cusername varchar(255),
+    Pusername varchar(255),
+    Vname varchar(255),
+    Time date,
+    PRIMARY KEY (Id)
+);
+
+-- history of one patient or one caregiver (show_appointments archived)
+CREATE INDEX IX_AppointmentsArchive_Pusername_Time ON AppointmentsArchive (Pusername, Time, Id);
+CREATE INDEX IX_AppointmentsArchive_Cusername_Time ON AppointmentsArchive (Cusername, Time, Id);
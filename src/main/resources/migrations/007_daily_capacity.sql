@@ -0,0 +1,15 @@
+-- open caregiver slots and booked appointments of every day, kept up to date by the commands that write
+-- Availabilities and Appointments (see model/DailyCapacity.py), so a day's capacity is one row instead of a count
+CREATE TABLE DailyCapacity (
+    Time date,
+    Available int,
+    Booked int,
+    PRIMARY KEY (Time)
+);
+
+INSERT INTO DailyCapacity (Time, Available, Booked)
+SELECT Time, SUM(Available), SUM(Booked) FROM (
+    SELECT Time, 1 AS Available, 0 AS Booked FROM Availabilities
+    UNION ALL
+    SELECT Time, 0 AS Available, 1 AS Booked FROM Appointments
+) AS Slots GROUP BY Time;
@@ -0,0 +1,182 @@
+"""This module runs a script of scheduler commands non-interactively and reports the results as JSON lines."""
+from db.ConnectionManager import ConnectionManager
+from db.ConnectionManager import DatabaseError
+from util import Output
+import Scheduler
+from contextlib import nullcontext
+import argparse
+import json
+import sys
+import time
+
+# commands that spend a key derivation on a password; holding a group's locks through it would stall other writers
+HASHING_COMMANDS = {"create_patient", "create_caregiver", "login_patient", "login_caregiver"}
+
+
+class BatchCommand:
+    def __init__(self, line_number, text, tokens):
+        self.line_number = line_number
+        self.text = text
+        self.tokens = tokens
+
+
+def parse_script(lines):
+    """
+    Parse a whole script up front, before anything runs.
+    Blank lines and lines starting with # are skipped.
+    --------
+    Returns:
+    commands: a list of BatchCommand to run, in script order
+    rejects: a list of (line number, text, reason) for lines that can never run
+    """
+    commands = []
+    rejects = []
+    for line_number, text in enumerate(lines, start=1):
+        text = text.strip()
+        if len(text) == 0 or text.startswith("#"):
+            continue
+        tokens = Scheduler.parse(text)
+        operation = tokens[0]
+        if operation == "quit":
+            break
+        if operation not in Scheduler.COMMANDS:
+            rejects.append((line_number, text, "Invalid Argument"))
+            continue
+        # arguments in [brackets] are optional
+        arguments = Scheduler.COMMANDS[operation][1].split()
+        required = len([argument for argument in arguments if not argument.startswith("[")])
+        if not required <= len(tokens) - 1 <= len(arguments):
+            expected = str(required) if required == len(arguments) else f"{required} to {len(arguments)}"
+            rejects.append((line_number, text, f"Expected {expected} argument(s)"))
+            continue
+        commands.append(BatchCommand(line_number, text, tokens))
+    return commands, rejects
+
+
+def group(commands, group_size):
+    """
+    Split the commands into consecutive groups of at most group_size, each run in one shared transaction.
+    A command in HASHING_COMMANDS ends the group before it and makes a group of its own, run outside any shared
+    transaction, so no group holds its locks while a password is hashed.
+    """
+    groups = []
+    current = []
+    for command in commands:
+        if command.tokens[0] in HASHING_COMMANDS:
+            if len(current) > 0:
+                groups.append(current)
+                current = []
+            groups.append([command])
+        else:
+            current.append(command)
+            if len(current) >= group_size:
+                groups.append(current)
+                current = []
+    if len(current) > 0:
+        groups.append(current)
+    return groups
+
+
+def run_group(commands, max_seconds):
+    """
+    Run commands from the start of a group in one shared transaction, committing early once it has been open
+    for max_seconds, so a slow group does not keep other writers waiting.
+    A group of one hashing command runs on its own connections instead.
+    --------
+    Returns:
+    ran: the number of commands of the group run, the rest is left for the next transaction
+    results: one JSON-ready dictionary per command run, with an "error" if the command raised
+    failed: whether the transaction was rolled back as a whole
+    """
+    shared_group = commands[0].tokens[0] not in HASHING_COMMANDS
+    results = []
+    # the number of commands started, counted before each one begins, so a failed commit covers exactly those
+    started = 0
+    opened = time.perf_counter()
+    try:
+        with (ConnectionManager.shared() if shared_group else nullcontext()) as shared:
+            for command in commands:
+                started += 1
+                if shared_group:
+                    shared.begin_command()
+                with Output.capture() as output:
+                    try:
+                        Scheduler.execute(command.tokens)
+                        error = None
+                    except DatabaseError:
+                        # the group's transaction itself failed, roll all of it back below
+                        raise
+                    except Exception as err:
+                        # a bug in one command only undoes that command, back to its savepoint
+                        if shared_group:
+                            shared.rollback()
+                        error = "Command failed: " + type(err).__name__ + ": " + str(err)
+                result = {"line": command.line_number, "command": command.tokens[0], "output": output}
+                if error is not None:
+                    result["error"] = error
+                results.append(result)
+                if time.perf_counter() - opened >= max_seconds:
+                    break
+        return len(results), results, False
+    except DatabaseError as db_err:
+        # the group's transaction is gone; anything cached from it may be stale as well
+        Scheduler.schedule_cache.clear()
+        Scheduler.vaccine_cache.clear()
+        if Scheduler.availability_calendar is not None:
+            Scheduler.availability_calendar.invalidate()
+        ran = commands[:started]
+        return len(ran), [{"line": command.line_number, "command": command.tokens[0],
+                           "error": "Group rolled back: " + str(db_err)} for command in ran], True
+
+
+def run(lines, out, group_size=100, max_seconds=1.0):
+    """
+    Run a script and write one JSON object per command to out, followed by a summary.
+    Every group of commands shares one pooled connection and one transaction, with a savepoint per command,
+    so a failing command only rolls back its own work. A group is committed after group_size commands or
+    max_seconds, whichever comes first.
+    """
+    Output.install()
+    Scheduler.login_state.set(Scheduler.LoginState())
+    started = time.perf_counter()
+    commands, rejects = parse_script(lines)
+    for line_number, text, reason in rejects:
+        out.write(json.dumps({"line": line_number, "command": text, "error": reason}) + "\n")
+
+    executed = 0
+    failed_groups = 0
+    for commands_in_group in group(commands, group_size):
+        while len(commands_in_group) > 0:
+            ran, results, failed = run_group(commands_in_group, max_seconds)
+            if failed:
+                failed_groups += 1
+            for result in results:
+                out.write(json.dumps(result) + "\n")
+            executed += ran
+            commands_in_group = commands_in_group[ran:]
+            out.flush()
+
+    seconds = time.perf_counter() - started
+    summary = {"commands": executed, "rejected": len(rejects), "failed_groups": failed_groups,
+               "seconds": round(seconds, 3), "commands_per_second": round(executed / seconds, 1) if seconds else None}
+    out.write(json.dumps({"summary": summary}) + "\n")
+    return failed_groups == 0 and len(rejects) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scheduler commands from a file or stdin, one per line")
+    parser.add_argument("script", nargs="?", default="-", help="file of commands, - for stdin (default)")
+    parser.add_argument("--group-size", type=int, default=100,
+                        help="commands sharing one connection and transaction (default 100)")
+    parser.add_argument("--group-seconds", type=float, default=1.0,
+                        help="seconds after which a group's transaction is committed early (default 1.0)")
+    args = parser.parse_args()
+
+    script = sys.stdin if args.script == "-" else open(args.script)
+    try:
+        ok = run(script.readlines(), sys.stdout, group_size=args.group_size, max_seconds=args.group_seconds)
+    finally:
+        if script is not sys.stdin:
+            script.close()
+        ConnectionManager.close_pool()
+    sys.exit(0 if ok else 1)
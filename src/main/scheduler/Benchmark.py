@@ -0,0 +1,258 @@
+"""This module load-tests the scheduler commands with simulated concurrent patients and caregivers."""
+from db.ConnectionManager import ConnectionManager
+from model.DailyCapacity import DailyCapacity
+from model.Vaccine import TOTAL_DOSES
+from util.Metrics import metrics
+from util.Util import Util
+from util import Output
+import Scheduler
+import argparse
+import datetime
+import json
+import random
+import re
+import secrets
+import threading
+import time
+
+# how often a patient runs each command between its login and the end of the run
+PATIENT_MIX = [
+    ("search_caregiver_schedule", 40),
+    ("reserve", 25),
+    ("show_appointments", 20),
+    ("cancel", 15),
+]
+
+CAREGIVER_MIX = [
+    ("search_caregiver_schedule", 50),
+    ("show_appointments", 50),
+]
+
+
+class Recorder:
+    """Collects the latency of every command run by every simulated user."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def run(self, tokens):
+        started = time.perf_counter()
+        with Output.capture() as output:
+            Scheduler.execute(tokens)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies.setdefault(tokens[0], []).append(elapsed)
+            if any("error" in line.lower() or "failed" in line.lower() for line in output):
+                self.failures[tokens[0]] = self.failures.get(tokens[0], 0) + 1
+        return output
+
+    def report(self, seconds):
+        commands = {}
+        for command, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            commands[command] = {
+                "count": len(latencies),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "round_trips": round(round_trips(command) / len(latencies), 2),
+                "failures": self.failures.get(command, 0),
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {"commands": total, "seconds": round(seconds, 3),
+                "commands_per_second": round(total / seconds, 1) if seconds else None, "per_command": commands}
+
+
+def round_trips(command):
+    """This function returns the statements, commits and rollbacks the database served for a command so far."""
+    return metrics.get_counter("db_queries_total", {"command": command}) + \
+        metrics.get_counter("db_transactions_total", {"command": command, "outcome": "commit"}) + \
+        metrics.get_counter("db_transactions_total", {"command": command, "outcome": "rollback"})
+
+
+def percentile(values, p):
+    """This function returns the nearest-rank percentile of sorted values."""
+    if len(values) == 0:
+        return 0.0
+    rank = max(1, -(-p * len(values) // 100))
+    return values[int(rank) - 1]
+
+
+def pick(mix, rng):
+    return rng.choices([command for command, _ in mix], weights=[weight for _, weight in mix])[0]
+
+
+class Workload:
+    """
+    The users, days and vaccine of one benchmark run, all named after a random run ID and set far in the future,
+    so that runs can share a database with real data and with each other.
+    """
+
+    def __init__(self, patients, caregivers, days, doses, iterations, seed):
+        self.run_id = "bench" + secrets.token_hex(4)
+        self.patients = [f"{self.run_id}p{i}" for i in range(patients)]
+        self.caregivers = [f"{self.run_id}c{i}" for i in range(caregivers)]
+        first = datetime.date(2100, 1, 1) + datetime.timedelta(days=secrets.randbelow(3650))
+        self.days = [(first + datetime.timedelta(days=i)).strftime("%m-%d-%Y") for i in range(days)]
+        self.first_day = datetime.datetime(first.year, first.month, first.day)
+        self.last_day = self.first_day + datetime.timedelta(days=days - 1)
+        self.vaccine = self.run_id
+        self.doses = doses
+        self.iterations = iterations
+        self.seed = seed
+        self.password = "benchmark"
+
+    def setup(self):
+        # every account shares one hash, so the setup does not spend minutes in the key derivation
+        salt = Util.generate_salt()
+        hash = Util.generate_hash(self.password, salt)
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO Patients VALUES (%s, %s, %s)", [(p, salt, hash) for p in self.patients])
+            cursor.executemany("INSERT INTO Caregivers VALUES (%s, %s, %s)", [(c, salt, hash) for c in self.caregivers])
+            cursor.execute("INSERT INTO Vaccines VALUES (%s, %d)", (self.vaccine, self.doses))
+            conn.commit()
+
+    def caregiver(self, username, recorder, rng):
+        Scheduler.login_state.set(Scheduler.LoginState())
+        recorder.run(["login_caregiver", username, self.password])
+        for day in self.days:
+            recorder.run(["upload_availability", day])
+        for i in range(self.iterations):
+            command = pick(CAREGIVER_MIX, rng)
+            if command == "search_caregiver_schedule":
+                recorder.run([command, rng.choice(self.days)])
+            else:
+                recorder.run([command])
+        recorder.run(["logout"])
+
+    def patient(self, username, recorder, rng):
+        Scheduler.login_state.set(Scheduler.LoginState())
+        recorder.run(["login_patient", username, self.password])
+        booked = []
+        for i in range(self.iterations):
+            command = pick(PATIENT_MIX, rng)
+            if command == "search_caregiver_schedule":
+                recorder.run([command, rng.choice(self.days)])
+            elif command == "reserve":
+                output = recorder.run([command, rng.choice(self.days), self.vaccine])
+                booked.extend(int(match) for line in output for match in re.findall(r"appointment ID is (\d+)", line))
+            elif command == "cancel" and len(booked) > 0:
+                recorder.run([command, str(booked.pop(rng.randrange(len(booked))))])
+            elif command == "show_appointments":
+                recorder.run([command])
+        recorder.run(["logout"])
+
+    def check(self):
+        """
+        Count the broken invariants left behind by the run.
+        --------
+        Returns:
+        double_booked: caregiver days or patient days with more than one appointment, plus booked caregiver days
+                       that are still offered as available
+        oversold: doses handed out beyond the vaccine's stock, i.e. how far its count is below what the
+                  remaining appointments allow, plus any negative count
+        capacity_drift: days whose DailyCapacity row disagrees with their availabilities and appointments
+        """
+        placeholders = ", ".join(["%s"] * len(self.patients))
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM (SELECT Cusername, Time FROM Appointments WHERE Vname = %s "
+                           "GROUP BY Cusername, Time HAVING COUNT(*) > 1) AS Twice", self.vaccine)
+            double_booked = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM (SELECT Pusername, Time FROM Appointments WHERE Vname = %s "
+                           "GROUP BY Pusername, Time HAVING COUNT(*) > 1) AS Twice", self.vaccine)
+            double_booked += cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM Appointments JOIN Availabilities ON "
+                           "(Availabilities.Username = Appointments.Cusername AND Availabilities.Time = Appointments.Time) "
+                           "WHERE Vname = %s", self.vaccine)
+            double_booked += cursor.fetchone()[0]
+
+            cursor.execute(f"SELECT COUNT(*) FROM Appointments WHERE Pusername IN ({placeholders})",
+                           tuple(self.patients))
+            appointments = cursor.fetchone()[0]
+            cursor.execute(TOTAL_DOSES + " WHERE Name = %s", self.vaccine)
+            doses = cursor.fetchone()[1]
+        oversold = max(0, (self.doses - appointments) - doses) + max(0, -doses)
+        capacity_drift = DailyCapacity.check(self.first_day, self.last_day)
+        return {"appointments": appointments, "doses_left": doses, "double_booked": double_booked,
+                "oversold": oversold, "capacity_drift": capacity_drift}
+
+    def cleanup(self):
+        patients = ", ".join(["%s"] * len(self.patients))
+        caregivers = ", ".join(["%s"] * len(self.caregivers))
+        with ConnectionManager() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DELETE FROM Appointments WHERE Pusername IN ({patients})", tuple(self.patients))
+            cursor.execute(f"DELETE FROM Availabilities WHERE Username IN ({caregivers})", tuple(self.caregivers))
+            cursor.execute("DELETE FROM VaccineShards WHERE Name = %s", self.vaccine)
+            cursor.execute("DELETE FROM Vaccines WHERE Name = %s", self.vaccine)
+            cursor.execute(f"DELETE FROM Patients WHERE Username IN ({patients})", tuple(self.patients))
+            cursor.execute(f"DELETE FROM Caregivers WHERE Username IN ({caregivers})", tuple(self.caregivers))
+            conn.commit()
+        # the deletes above bypass the commands that keep the summary current
+        DailyCapacity.rebuild(self.first_day, self.last_day)
+
+
+def run(workload):
+    """Run every simulated user on its own thread at the same time, returning the report of the run."""
+    Output.install()
+    workload.setup()
+    # only count the database work of the simulated users
+    metrics.clear()
+    recorder = Recorder()
+    threads = []
+    for i, username in enumerate(workload.caregivers):
+        rng = random.Random(f"{workload.seed}c{i}")
+        threads.append(threading.Thread(target=workload.caregiver, args=(username, recorder, rng)))
+    for i, username in enumerate(workload.patients):
+        rng = random.Random(f"{workload.seed}p{i}")
+        threads.append(threading.Thread(target=workload.patient, args=(username, recorder, rng)))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = recorder.report(time.perf_counter() - started)
+    report["integrity"] = workload.check()
+    return report
+
+
+def print_report(report):
+    print(f"{report['commands']} commands in {report['seconds']}s, {report['commands_per_second']} commands/s")
+    print(f"{'command':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'trips':>8}{'failed':>8}")
+    for command, stats in report["per_command"].items():
+        print(f"{command:<28}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['round_trips']:>8}{stats['failures']:>8}")
+    integrity = report["integrity"]
+    print(f"appointments: {integrity['appointments']}, doses left: {integrity['doses_left']}, "
+          f"double-booked: {integrity['double_booked']}, oversold: {integrity['oversold']}, "
+          f"capacity drift: {integrity['capacity_drift']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the scheduler commands with concurrent simulated users")
+    parser.add_argument("--patients", type=int, default=50, help="simulated patients (default 50)")
+    parser.add_argument("--caregivers", type=int, default=10, help="simulated caregivers (default 10)")
+    parser.add_argument("--days", type=int, default=5, help="days the caregivers are available on (default 5)")
+    parser.add_argument("--doses", type=int, default=100, help="doses of the benchmark vaccine (default 100)")
+    parser.add_argument("--iterations", type=int, default=20, help="commands per user after login (default 20)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the command mix (default 0)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark's users and appointments")
+    args = parser.parse_args()
+
+    workload = Workload(args.patients, args.caregivers, args.days, args.doses, args.iterations, args.seed)
+    try:
+        report = run(workload)
+        if not args.keep:
+            workload.cleanup()
+    finally:
+        ConnectionManager.close_pool()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
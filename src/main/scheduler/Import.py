@@ -0,0 +1,144 @@
+"""This module imports patient or caregiver accounts in bulk from a CSV file and reports the results as JSON lines."""
+from db.ConnectionManager import ConnectionManager
+from db.ConnectionManager import DatabaseError
+from util.HashPool import HashPool
+from util.Util import Util
+import argparse
+import csv
+import json
+import sys
+import time
+
+TABLES = {
+    "patients": "Patients",
+    "caregivers": "Caregivers",
+}
+
+# SQL Server accepts at most 2100 parameters per statement, which bounds the IN list of one chunk
+MAX_CHUNK_SIZE = 1000
+
+
+def read_chunks(rows, chunk_size):
+    """
+    Stream (line number, username, password) chunks out of CSV rows, reporting malformed rows on the way.
+    A first row of "username,password" is taken as a header and skipped.
+    Usernames and passwords are lower-cased like everything typed at the prompt, so the accounts can log in there.
+    --------
+    Returns:
+    a generator of (chunk, rejects) pairs
+    """
+    chunk = []
+    rejects = []
+    for line_number, row in enumerate(rows, start=1):
+        if len(row) == 0:
+            continue
+        if line_number == 1 and [field.strip().lower() for field in row] == ["username", "password"]:
+            continue
+        if len(row) != 2 or len(row[0].strip()) == 0 or len(row[1].strip()) == 0:
+            rejects.append((line_number, row[0] if len(row) > 0 else "", "Expected username,password"))
+            continue
+        chunk.append((line_number, row[0].strip().lower(), row[1].strip().lower()))
+        if len(chunk) >= chunk_size:
+            yield chunk, rejects
+            chunk, rejects = [], []
+    if len(chunk) > 0 or len(rejects) > 0:
+        yield chunk, rejects
+
+
+def existing_usernames(cursor, table, usernames):
+    """This function returns which of the given usernames are taken already, in one query."""
+    if len(usernames) == 0:
+        return set()
+    placeholders = ", ".join(["%s"] * len(usernames))
+    cursor.execute(f"SELECT Username FROM {table} WHERE Username IN ({placeholders})", tuple(usernames))
+    return {row["Username"] for row in cursor.fetchall()}
+
+
+def import_chunk(table, chunk, seen):
+    """
+    Insert one chunk of accounts in a single transaction.
+    Rows whose username was taken, either in the database or earlier in the file, are rejected and not hashed.
+    --------
+    Returns:
+    created: the number of accounts inserted
+    rejects: a list of (line number, username, reason)
+    """
+    rejects = []
+    try:
+        with ConnectionManager() as conn:
+            taken = existing_usernames(conn.cursor(as_dict=True), table, list({username for _, username, _ in chunk}))
+    except DatabaseError as db_err:
+        return 0, [(line_number, username, "Chunk failed: " + str(db_err)) for line_number, username, _ in chunk]
+
+    accepted = []
+    for line_number, username, password in chunk:
+        if username in taken or username in seen:
+            rejects.append((line_number, username, "Username taken"))
+            continue
+        seen.add(username)
+        accepted.append((line_number, username, password))
+    if len(accepted) == 0:
+        return 0, rejects
+
+    # the slow key derivation runs across every worker of the hash pool, with no connection checked out
+    salts = [Util.generate_salt() for _ in accepted]
+    hashes = HashPool.map([password for _, _, password in accepted], salts)
+
+    with ConnectionManager() as conn:
+        cursor = conn.cursor(as_dict=True)
+        try:
+            cursor.executemany(f"INSERT INTO {table} VALUES (%s, %s, %s)",
+                               [(username, salt, hash) for (_, username, _), salt, hash in zip(accepted, salts, hashes)])
+            conn.commit()
+            return len(accepted), rejects
+        except DatabaseError as db_err:
+            # e.g. another terminal took one of the usernames since the check; nothing of the chunk was written
+            conn.rollback()
+            for line_number, username, _ in accepted:
+                seen.discard(username)
+                rejects.append((line_number, username, "Chunk failed: " + str(db_err)))
+            return 0, rejects
+
+
+def run(rows, table, out, chunk_size=500):
+    """Import every account of the CSV rows into table, writing one JSON object per reject and a summary to out."""
+    started = time.perf_counter()
+    created = 0
+    rejected = 0
+    seen = set()
+    for chunk, rejects in read_chunks(rows, chunk_size):
+        if len(chunk) > 0:
+            chunk_created, chunk_rejects = import_chunk(table, chunk, seen)
+            created += chunk_created
+            rejects = rejects + chunk_rejects
+        for line_number, username, reason in sorted(rejects):
+            out.write(json.dumps({"line": line_number, "username": username, "error": reason}) + "\n")
+        rejected += len(rejects)
+        out.flush()
+
+    seconds = time.perf_counter() - started
+    summary = {"created": created, "rejected": rejected, "seconds": round(seconds, 3),
+               "accounts_per_second": round(created / seconds, 1) if seconds else None}
+    out.write(json.dumps({"summary": summary}) + "\n")
+    return rejected == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create patient or caregiver accounts from a username,password CSV")
+    parser.add_argument("kind", choices=sorted(TABLES), help="the kind of account to create")
+    parser.add_argument("csv", nargs="?", default="-", help="CSV file, - for stdin (default)")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help=f"accounts checked, hashed and inserted together (default 500, at most {MAX_CHUNK_SIZE})")
+    args = parser.parse_args()
+    if not 0 < args.chunk_size <= MAX_CHUNK_SIZE:
+        parser.error(f"--chunk-size must be between 1 and {MAX_CHUNK_SIZE}")
+
+    source = sys.stdin if args.csv == "-" else open(args.csv, newline="")
+    try:
+        ok = run(csv.reader(source), TABLES[args.kind], sys.stdout, chunk_size=args.chunk_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        HashPool.shutdown()
+        ConnectionManager.close_pool()
+    sys.exit(0 if ok else 1)
@@ -1,21 +1,67 @@
 """This module executes the vaccine scheduler system."""
-from model.Vaccine import Vaccine
+from model.Vaccine import Vaccine, TOTAL_DOSES
 from model.Caregiver import Caregiver
 from model.Patient import Patient
+from model.Appointment import Appointment, ReservationStatus, CancelStatus
+from model.DailyCapacity import DailyCapacity
 from util.Util import Util
+from util.HashPool import HashPool
+from util.SessionStore import SessionStore
+from util.Cache import Cache
+from util.AvailabilityCalendar import AvailabilityCalendar
+from util.Metrics import metrics
+from util.Recurrence import Recurrence, MAX_DAYS
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.ConnectionManager import DatabaseError
+from db.Migrator import Migrator
+from db.Retention import Retention
+from db.IdAllocator import MAX_ID
+import argparse
+import contextvars
+import csv
 import datetime
-import random
+import json
+import os
+import sys
 
-'''
-objects to keep track of the currently logged-in user
-Note: it is always true that at most one of currentCaregiver and currentPatient is not null
-        since only one user can be logged-in at a time
-'''
-current_patient = None
 
-current_caregiver = None
+class LoginState:
+    """
+    objects to keep track of the currently logged-in user
+    Note: it is always true that at most one of caregiver and patient is not null
+            since only one user can be logged-in at a time per terminal
+    """
+    def __init__(self):
+        self.patient = None
+        self.caregiver = None
+        # session token of the logged-in user, which lets a later login skip the password check
+        self.token = None
+
+
+# the login state of the terminal running the current command; the interactive prompt uses the default one,
+# while the network server sets a fresh LoginState for every client connection
+login_state = contextvars.ContextVar("login_state")
+default_login_state = LoginState()
+
+
+def current_state():
+    """This internal method returns the login state of the terminal running the current command."""
+    return login_state.get(default_login_state)
+
+
+sessions = SessionStore(max_size=int(os.getenv("SessionMax", "10000")), ttl=float(os.getenv("SessionTTL", "3600")),
+                        path=os.getenv("SessionFile"))
+
+# read-through caches in front of get_schedule and get_vaccine, invalidated by the commands that write to them
+schedule_cache = Cache(max_size=int(os.getenv("CacheSize", "256")), ttl=float(os.getenv("CacheTTL", "30")))
+vaccine_cache = Cache(max_size=1, ttl=float(os.getenv("CacheTTL", "30")))
+
+# with Calendar set to 1, every caregiver's availability is kept in memory and the schedule searches are served
+# from it instead of the schedule cache and the Availabilities table
+availability_calendar = None
+if os.getenv("Calendar") == "1":
+    availability_calendar = AvailabilityCalendar(lambda: load_availabilities(),
+                                                 ttl=float(os.getenv("CalendarTTL", "60")))
 
 
 def create_patient(tokens):
@@ -34,7 +80,7 @@ def create_patient(tokens):
         return
 
     salt = Util.generate_salt()
-    hash = Util.generate_hash(password, salt)
+    hash = HashPool.generate_hash(password, salt)
 
     # create the patient
     try:
@@ -46,28 +92,24 @@ def create_patient(tokens):
             print("Create failed, Cannot save")
             return
         print(" *** Account created successfully *** ")
-    except pymssql.Error:
+    except DatabaseError:
         print("Create failed")
         return
 
 
 def username_exists_patient(username):
     """This function checks if there is an existed username of the patient."""
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-
     select_username = "SELECT * FROM Patients WHERE Username = %s"
-    try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_username, username)
-        # returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
-        for row in cursor:
-            return row['Username'] is not None
-    except pymssql.Error:
-        print("Error occurred when checking username")
-        cm.close_connection()
-        return
-    cm.close_connection()
+    with ConnectionManager() as conn:
+        try:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute(select_username, username)
+            # returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
+            for row in cursor:
+                return row['Username'] is not None
+        except DatabaseError:
+            print("Error occurred when checking username")
+            return
     return False
 
 
@@ -87,7 +129,7 @@ def create_caregiver(tokens):
         return
 
     salt = Util.generate_salt()
-    hash = Util.generate_hash(password, salt)
+    hash = HashPool.generate_hash(password, salt)
 
     # create the caregiver
     try:
@@ -99,37 +141,33 @@ def create_caregiver(tokens):
             print("Create failed, Cannot save")
             return
         print(" *** Account created successfully *** ")
-    except pymssql.Error:
+    except DatabaseError:
         print("Create failed")
         return
 
 
 def username_exists_caregiver(username):
     """This function checks if there is an existed username of the caregiver."""
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-
     select_username = "SELECT * FROM Caregivers WHERE Username = %s"
-    try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_username, username)
-        # returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
-        for row in cursor:
-            return row['Username'] is not None
-    except pymssql.Error:
-        print("Error occurred when checking username")
-        cm.close_connection()
-        return
-    cm.close_connection()
+    with ConnectionManager() as conn:
+        try:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute(select_username, username)
+            # returns false if the cursor is not before the first record or if there are no rows in the ResultSet.
+            for row in cursor:
+                return row['Username'] is not None
+        except DatabaseError:
+            print("Error occurred when checking username")
+            return
     return False
 
 
 def login_patient(tokens):
     """This function logs in the patient with given username and password."""
+    state = current_state()
     # login_patient <username> <password>
     # check 1: if someone's already logged-in, they need to log out first
-    global current_patient
-    if current_caregiver is not None or current_patient is not None:
+    if state.caregiver is not None or state.patient is not None:
         print("Already logged-in!")
         return
 
@@ -149,7 +187,7 @@ def login_patient(tokens):
         except:
             print("Get Failed")
             return
-    except pymssql.Error:
+    except DatabaseError:
         print("Error occurred when logging in")
         return
 
@@ -158,15 +196,17 @@ def login_patient(tokens):
         print("Please try again!")
     else:
         print("Patient logged in as: " + username)
-        current_patient = patient
+        state.patient = patient
+        state.token = sessions.issue("patient", username)
+        print("Session token: " + state.token)
 
 
 def login_caregiver(tokens):
     """This function logs in the caregiver with given username and password."""
+    state = current_state()
     # login_caregiver <username> <password>
     # check 1: if someone's already logged-in, they need to log out first
-    global current_caregiver
-    if current_caregiver is not None or current_patient is not None:
+    if state.caregiver is not None or state.patient is not None:
         print("Already logged-in!")
         return
 
@@ -186,7 +226,7 @@ def login_caregiver(tokens):
         except:
             print("Get Failed")
             return
-    except pymssql.Error:
+    except DatabaseError:
         print("Error occurred when logging in")
         return
 
@@ -195,12 +235,66 @@ def login_caregiver(tokens):
         print("Please try again!")
     else:
         print("Caregiver logged in as: " + username)
-        current_caregiver = caregiver
+        state.caregiver = caregiver
+        state.token = sessions.issue("caregiver", username)
+        print("Session token: " + state.token)
+
+
+def login_token(tokens):
+    """This function logs in a user again with the session token issued at their last password login."""
+    state = current_state()
+    # login_token <token>
+    # check 1: if someone's already logged-in, they need to log out first
+    if state.caregiver is not None or state.patient is not None:
+        print("Already logged-in!")
+        return
+
+    # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
+    if len(tokens) != 2:
+        print("Please try again!")
+        return
+
+    # check 3: if the token belongs to a live session
+    session = sessions.resolve(tokens[1])
+    if session is None:
+        print("Session expired or invalid, please login again!")
+        return
+
+    username = session.get_username()
+    if session.get_role() == "patient":
+        state.patient = Patient(username)
+        print("Patient logged in as: " + username)
+    else:
+        state.caregiver = Caregiver(username)
+        print("Caregiver logged in as: " + username)
+    state.token = tokens[1]
+
+
+def invalidate_schedule(d):
+    """This internal method drops the cached caregivers' schedule of the given date after it was written to."""
+    schedule_cache.invalidate(Util.to_date(d))
+
+
+def mark_available(d, caregiver):
+    """This internal method records in the availability calendar, if enabled, that a caregiver is available on a date."""
+    if availability_calendar is not None:
+        availability_calendar.add(d, caregiver)
+
+
+def mark_unavailable(d, caregiver):
+    """This internal method records in the availability calendar, if enabled, that a caregiver is no longer available."""
+    if availability_calendar is not None:
+        availability_calendar.remove(d, caregiver)
+
+
+def invalidate_vaccines():
+    """This internal method drops the cached vaccine inventory after it was written to."""
+    vaccine_cache.clear()
 
 
 def get_schedule(d):
     """
-    This internal method gets the available caregivers on the given date.
+    This internal method gets the available caregivers on the given date, served from the schedule cache if possible.
     --------
     Parameters:
     d: datetime in datetime(year, month, day) format
@@ -208,54 +302,72 @@ def get_schedule(d):
     Returns:
     caregiver_name: a list containing all usernames of available caregivers
     """
+    if availability_calendar is not None:
+        return availability_calendar.caregivers(d)
+    caregiver_name = schedule_cache.get_or_load(Util.to_date(d), lambda: load_schedule(d))
+    return list(caregiver_name) if caregiver_name is not None else None
+
+
+def load_schedule(d):
+    """This internal method reads the available caregivers on the given date from the database."""
     # can also be written inside function search_caregiver_schedule(tokens)
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
     caregiver_name = []
 
     get_caregiver_schedule = "SELECT Username FROM Availabilities WHERE Time = %s"
-    try:
-        cursor.execute(get_caregiver_schedule, d)
+    with ConnectionManager() as conn:
+        cursor = conn.cursor(as_dict=True)
+        try:
+            cursor.execute(get_caregiver_schedule, d)
+            for row in cursor:
+                caregiver_name.append(row["Username"])
+            return caregiver_name
+        except DatabaseError:
+            print("Error occurred when getting caregivers' schedule")
+            return
+
+
+def load_availabilities():
+    """This internal method streams every (date, caregiver) row of Availabilities, to fill the availability calendar."""
+    with ConnectionManager() as conn:
+        cursor = conn.cursor(as_dict=True)
+        cursor.execute("SELECT Time, Username FROM Availabilities")
         for row in cursor:
-            caregiver_name.append(row["Username"])
-        return caregiver_name
-    except pymssql.Error:
-        print("Error occurred when getting caregivers' schedule")
-        cm.close_connection()
-        return
+            yield row["Time"], row["Username"]
 
 
 def get_vaccine():
     """
-    This internal method gets all the vaccines' names with corresponding available doses.
+    This internal method gets all the vaccines' names with corresponding available doses, served from the cache if possible.
     --------
     Returns:
     vaccines: a dictionary with all the vaccine names as keys, and their corresponding available doses as values
     """
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
+    vaccines = vaccine_cache.get_or_load("vaccines", load_vaccine)
+    return dict(vaccines) if vaccines is not None else None
+
+
+def load_vaccine():
+    """This internal method reads all the vaccines' names with corresponding available doses from the database."""
     vaccines = {}
 
-    get_vaccines = "SELECT Name, Doses FROM Vaccines"
-    try:
-        cursor.execute(get_vaccines)
-        for row in cursor:
-            vaccines[row["Name"]] = row["Doses"]
-        return vaccines
-    except pymssql.Error:
-        print("Error occurred when getting vaccines")
-        cm.close_connection()
-        return
+    get_vaccines = TOTAL_DOSES
+    with ConnectionManager() as conn:
+        cursor = conn.cursor(as_dict=True)
+        try:
+            cursor.execute(get_vaccines)
+            for row in cursor:
+                vaccines[row["Name"]] = row["Doses"]
+            return vaccines
+        except DatabaseError:
+            print("Error occurred when getting vaccines")
+            return
 
 
 def search_caregiver_schedule(tokens):
     """This function gets the available caregivers' names on the given date."""
-    global current_caregiver
-    global current_patient
+    state = current_state()
     # check 1: if no one's already logged-in
-    if current_caregiver is None and current_patient is None:
+    if state.caregiver is None and state.patient is None:
         print("Please login first!")
         return
 
@@ -294,127 +406,87 @@ def search_caregiver_schedule(tokens):
         except:
             print("Search Caregivers' Schedule Failed")
             return
-    except pymssql.Error as db_err:
+    except DatabaseError as db_err:
         print("Error occurred when searching caregivers' schedule")
         return
 
 
-def appointment_id_exists(id):
+def load_schedule_counts(start, end):
     """
-    This internal method checks if the randomly generated appointment ID is already in the database.
+    This internal method streams the number of available caregivers of every day between two dates,
+    read from one DailyCapacity row per day instead of counting the Availabilities rows.
     --------
     Parameters:
-    id: int
+    start, end: datetime in datetime(year, month, day) format, both included
     --------
     Returns:
-    True, if id equals to any appointment ID record in the database
-    False, if id does not equal to any appointment ID record in the database
+    a generator of (date, number of caregivers) in date order, skipping the days nobody is available
     """
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-
-    select_id = "SELECT * FROM Appointments WHERE Id = %d"
-    try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_id, id)
-        if cursor.rowcount != 0:
-            return True
-    except pymssql.Error:
-        print("Error occurred when checking appointment ID")
-        cm.close_connection()
-        return
-    cm.close_connection()
-    return False
+    for capacity in DailyCapacity.get_range(start, end):
+        if capacity.get_available() > 0:
+            yield capacity.get_time(), capacity.get_available()
 
 
-def delete_availability(date, name):
-    """
-    This internal method delete the given caregiver's availability on the given date from the database.
-    --------
-    Parameters:
-    date: datetime in datetime(year, month, day) format
-    name: str
-    """
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-
-    del_availability = "DELETE FROM Availabilities WHERE (Time = %s AND Username = %s)"
-    try:
-        cursor.execute(del_availability, (date, name))
-        # you must call commit() to persist your data if you don't set autocommit to True
-        conn.commit()
-    except pymssql.Error:
-        conn.rollback()
-        print("Error occurred when deleting caregiver availability")
-        cm.close_connection()
+def search_caregiver_schedule_range(tokens):
+    """This function gets how many caregivers are available on each day between two dates."""
+    state = current_state()
+    # search_caregiver_schedule_range <start_date> <end_date>
+    # check 1: if no one's already logged-in
+    if state.caregiver is None and state.patient is None:
+        print("Please login first!")
         return
-    cm.close_connection()
 
+    # check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        print("Please try again!")
+        return
 
-def add_availability(date, name):
-    """
-    This internal method add the given caregiver's availability on the given date into the database.
-    --------
-    Parameters:
-    date: datetime in datetime(year, month, day) format
-    name: str
-    """
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-
-    add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
+    # check 3: if the datetime format is correct and the range is not too long
+    fmt = "%m-%d-%Y"
     try:
-        cursor.execute(add_availability, (date, name))
-        # you must call commit() to persist your data if you don't set autocommit to True
-        conn.commit()
-    except pymssql.Error:
-        conn.rollback()
-        print("Error occurred when updating caregiver availability")
-        cm.close_connection()
-    cm.close_connection()
-
-
-def check_appointment_date(pname, date):
-    """
-    This internal method check the given patient's appointment on the given date.
-    --------
-    Parameters:
-    pname: str
-    date: datetime in datetime(year, month, day) format
-    --------
-    Returns:
-    True, if there exists an appointment for that patient
-    False, if there does not exist an appointment for that patient
-    """
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
+        start = datetime.datetime.strptime(tokens[1], fmt)
+        end = datetime.datetime.strptime(tokens[2], fmt)
+    except ValueError:
+        print("Wrong date format! Should be MM-DD-YYYY")
+        return
+    if end < start:
+        print("The end date is before the start date!")
+        return
+    if (end - start).days >= MAX_DAYS:
+        print("A range can cover at most " + str(MAX_DAYS) + " days!")
+        return
 
+    # print the days as the rows arrive instead of collecting the whole window first
+    found = False
     try:
-        check_date = "SELECT Time FROM Appointments WHERE Pusername = %s"
-        cursor.execute(check_date, pname)
-        for row in cursor:
-            day = row["Time"]
-            d = datetime.datetime.strftime(day, "%m-%d-%Y")
-            if str(d) == date:
-                print(f"You have already scheduled an appointment on {date}")
-                return True
-    except:
-        print("Check appointment date failed")
-        return True
-    return False
+        if availability_calendar is not None:
+            schedule_counts = availability_calendar.counts(start, end)
+        else:
+            schedule_counts = load_schedule_counts(start, end)
+        for d, caregivers in schedule_counts:
+            if not found:
+                print(f"Available caregivers from {tokens[1]} to {tokens[2]}:")
+                found = True
+            print(f"{d.strftime(fmt)}: {caregivers}")
+        if not found:
+            print("No caregiver is available in that range!")
+            return
+        vaccines = get_vaccine()
+        print("Vaccine availability:")
+        print(vaccines)
+    except DatabaseError:
+        print("Error occurred when searching caregivers' schedule")
+        return
 
 
 def reserve(tokens):
     """This function reserve an appointment for a patient for the given vaccine name and date."""
+    state = current_state()
     # check 1: check if the current logged-in user is a patient
-    global current_patient
-    if current_patient is None:
+    if state.patient is None:
         print("Please login as a patient first!")
         return
-    pname = current_patient.username
+    pname = state.patient.username
 
     # check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
     if len(tokens) != 3:
@@ -436,75 +508,148 @@ def reserve(tokens):
     year = int(date_tokens[2])
     d = datetime.datetime(year, month, day)
 
-    # check 4: if the vaccines are out of stock
+    # reserve the slot, the dose and the appointment in a single transaction
     vname = tokens[2]
-    vaccines = get_vaccine()
     try:
-        if vaccines[vname] == 0:
-            print(f"Vaccine {vname} is out of stock!")
-            return
-    except KeyError:
-        print("No such vaccine, please try again!")
+        result = Appointment.reserve(pname, vname, d)
+    except:
+        print("Reservation failed, please try again!")
         return
 
-    # check 5: if the caregivers are all reserved
-    available_caregiver = get_schedule(d)
-    if len(available_caregiver) == 0:
+    if result.status is ReservationStatus.NO_SUCH_VACCINE:
+        print("No such vaccine, please try again!")
+    elif result.status is ReservationStatus.OUT_OF_STOCK:
+        invalidate_vaccines()
+        print(f"Vaccine {vname} is out of stock!")
+    elif result.status is ReservationStatus.NO_CAREGIVER:
         print("No caregiver is available on that day!")
+    elif result.status is ReservationStatus.ALREADY_BOOKED:
+        print(f"You have already scheduled an appointment on {date}")
+    else:
+        appointment = result.appointment
+        invalidate_schedule(d)
+        mark_unavailable(d, appointment.get_caregiver())
+        invalidate_vaccines()
+        print("Reservation success!")
+        print(f"Your caregiver is {appointment.get_caregiver()}, your appointment ID is {appointment.get_id()}")
+
+
+def parse_next_slot(tokens):
+    """
+    This internal method reads the <vaccine> [from_date] arguments of find_next_slot and reserve_next_slot.
+    --------
+    Returns:
+    (vaccine name, datetime to search from), or None after telling the user what is wrong
+    """
+    # the length for tokens need to be 2 or 3 (with the operation name), the date defaults to today
+    if len(tokens) not in (2, 3):
+        print("Please try again!")
+        return None
+    vname = tokens[1]
+    if len(tokens) == 3:
+        try:
+            from_date = datetime.datetime.strptime(tokens[2], "%m-%d-%Y")
+        except ValueError:
+            print("Wrong date format! Should be MM-DD-YYYY")
+            return None
+    else:
+        today = datetime.date.today()
+        from_date = datetime.datetime(today.year, today.month, today.day)
+
+    vaccines = get_vaccine()
+    if vaccines is None:
+        return None
+    if vname not in vaccines:
+        print("No such vaccine, please try again!")
+        return None
+    if vaccines[vname] <= 0:
+        print(f"Vaccine {vname} is out of stock!")
+        return None
+    return vname, from_date
+
+
+def find_next_slot(tokens):
+    """This function finds the earliest day from the given date, today by default, with an available caregiver."""
+    state = current_state()
+    # find_next_slot <vaccine> [from_date]
+    # check 1: if no one's already logged-in
+    if state.caregiver is None and state.patient is None:
+        print("Please login first!")
         return
 
-    # check 6: if the patient has already had an appointment on that day
-    if check_appointment_date(pname, date):
+    # check 2: the arguments are valid and the vaccine is in stock
+    arguments = parse_next_slot(tokens)
+    if arguments is None:
         return
+    vname, from_date = arguments
 
-    # reserve
+    # a patient is only offered the days they have not booked yet
+    patient = state.patient.username if state.patient is not None else None
     try:
-        assigned_caregiver = random.choice(available_caregiver)  # randomly assign a caregiver
-        appointment_id = random.randint(1000, 9999)  # randomly assign a 4-digit integer as the appointment ID
-
-        # assign a new appointment ID if there exists a same one in the database
-        while appointment_id_exists(appointment_id):
-            appointment_id = random.randint(1000, 9999)
-
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
+        if availability_calendar is not None:
+            booked = []
+            if patient is not None:
+                booked = [appointment.get_time() for appointment in
+                          Appointment.iter_appointments(patient, False, start=from_date)]
+            slot = availability_calendar.next_day(from_date, skip=booked)
+        else:
+            slot = Appointment.find_next_slot(from_date, patient)
+    except DatabaseError:
+        print("Error occurred when searching caregivers' schedule")
+        return
+    if slot is None:
+        print("No caregiver is available from that day on!")
+        return
+    print(f"Next available slot for {vname}: {slot.strftime('%m-%d-%Y')}")
 
-        # update the caregiver's availability
-        delete_availability(d, assigned_caregiver)
 
-        # decrease the vaccine dose
-        vaccine = Vaccine(vaccine_name=vname, available_doses=vaccines[vname]).get()
-        vaccine.decrease_available_doses(num=1)
+def reserve_next_slot(tokens):
+    """This function reserves the earliest available appointment from the given date, today by default."""
+    state = current_state()
+    # reserve_next_slot <vaccine> [from_date]
+    # check 1: check if the current logged-in user is a patient
+    if state.patient is None:
+        print("Please login as a patient first!")
+        return
 
-        # insert the appointment to DB
-        add_appointment = "INSERT INTO Appointments VALUES (%d, %s, %s, %s, %s)"
-        try:
-            cursor.execute(add_appointment, (appointment_id, assigned_caregiver, pname, vname, d))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            conn.rollback()
-            print("Error occurred when inserting appointment")
-            cm.close_connection()
-        cm.close_connection()
+    # check 2: the arguments are valid and the vaccine is in stock
+    arguments = parse_next_slot(tokens)
+    if arguments is None:
+        return
+    vname, from_date = arguments
 
-        print("Reservation success!")
-        print(f"Your caregiver is {assigned_caregiver}, your appointment ID is {appointment_id}")
+    try:
+        result = Appointment.reserve_next(state.patient.username, vname, from_date)
     except:
         print("Reservation failed, please try again!")
         return
 
+    if result.status is ReservationStatus.NO_SUCH_VACCINE:
+        print("No such vaccine, please try again!")
+    elif result.status is ReservationStatus.OUT_OF_STOCK:
+        invalidate_vaccines()
+        print(f"Vaccine {vname} is out of stock!")
+    elif result.status is ReservationStatus.SUCCESS:
+        appointment = result.appointment
+        invalidate_schedule(appointment.get_time())
+        mark_unavailable(appointment.get_time(), appointment.get_caregiver())
+        invalidate_vaccines()
+        print("Reservation success!")
+        print(f"Your caregiver is {appointment.get_caregiver()}, your appointment ID is {appointment.get_id()}, "
+              f"on {appointment.get_time().strftime('%m-%d-%Y')}")
+    else:
+        print("No caregiver is available from that day on!")
+
 
 def upload_availability(tokens):
     """This function upload caregiver's availability on the given date into the database."""
+    state = current_state()
     # upload_availability <date>
     # check 1: check if the current logged-in user is a caregiver
-    global current_caregiver
-    if current_caregiver is None:
+    if state.caregiver is None:
         print("Please login as a caregiver first!")
         return
-    name = current_caregiver.username
+    name = state.caregiver.username
 
     # check 2: the length for tokens need to be exactly 2 to include all information (with the operation name)
     if len(tokens) != 2:
@@ -527,189 +672,156 @@ def upload_availability(tokens):
     d = datetime.datetime(year, month, day)
 
     # check 4: check if an appointment has already been scheduled on that day
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-
     check_app = "SELECT * FROM Appointments WHERE (Cusername = %s AND Time = %s)"
     try:
-        cursor.execute(check_app, (name, d))
-        if cursor.rowcount != 0:
-            print("You have appointment on that day!")
-            cm.close_connection()
-            return
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute(check_app, (name, d))
+            if cursor.fetchone() is not None:
+                print("You have appointment on that day!")
+                return
     except:
         print("Error occurred when checking appointments")
-        cm.close_connection()
         return
 
     # upload availability
     try:
         try:
-            current_caregiver.upload_availability(d)
+            state.caregiver.upload_availability(d)
         except:
             print("Upload Availability Failed")
             return
+        invalidate_schedule(d)
+        mark_available(d, name)
         print("Availability uploaded!")
     except ValueError:
         print("Please enter a valid date!")
         return
-    except pymssql.Error as db_err:
+    except DatabaseError as db_err:
         print("Error occurred when uploading availability")
         return
 
 
+def upload_availability_range(tokens):
+    """This function uploads caregiver's availability on every matching day between two dates in one transaction."""
+    state = current_state()
+    # upload_availability_range <start_date> <end_date> <days>
+    # check 1: check if the current logged-in user is a caregiver
+    if state.caregiver is None:
+        print("Please login as a caregiver first!")
+        return
+
+    # check 2: the length for tokens need to be exactly 4 to include all information (with the operation name)
+    if len(tokens) != 4:
+        print("Please try again!")
+        return
+
+    # check 3: if the datetime format is correct
+    fmt = "%m-%d-%Y"
+    try:
+        start = datetime.datetime.strptime(tokens[1], fmt)
+        end = datetime.datetime.strptime(tokens[2], fmt)
+    except ValueError:
+        print("Wrong date format! Should be MM-DD-YYYY")
+        return
+
+    # check 4: the days are one of daily, weekdays, weekends or a list such as mon,wed,fri
+    try:
+        dates = Recurrence(start, end, tokens[3]).dates()
+    except ValueError as err:
+        print(str(err))
+        return
+    if len(dates) == 0:
+        print("No matching day in that range!")
+        return
+
+    try:
+        uploaded, booked, existing = state.caregiver.upload_availabilities(dates)
+    except DatabaseError:
+        print("Upload Availability Failed")
+        return
+    for d in uploaded:
+        invalidate_schedule(d)
+        mark_available(d, state.caregiver.username)
+    print("Availability uploaded on " + str(len(uploaded)) + " day(s)!")
+    if len(booked) > 0:
+        print("Skipped days with an appointment: " + ", ".join(d.strftime(fmt) for d in booked))
+    if len(existing) > 0:
+        print("Skipped days already available: " + ", ".join(d.strftime(fmt) for d in existing))
+
+
 def cancel(tokens):
-    """This function cancels the existing appointment for the given appointment ID."""
-    # this function is too redundant and needs simplification
-    global current_caregiver
-    global current_patient
+    """
+    This function cancels the existing appointment(s) for the given appointment ID, comma separated IDs, or date.
+    Cancelling by date cancels every appointment of the logged-in user on that day.
+    """
+    state = current_state()
+    # cancel <appointment_id[,appointment_id...]|date>
     # check 1: the length for tokens need to be exactly 2 to include all information (with the operation name)
     if len(tokens) != 2:
         print("Please try again!")
         return
 
     # check 2: if no one's already logged-in
-    if current_caregiver is None and current_patient is None:
+    if state.caregiver is None and state.patient is None:
         print("Please login first!")
         return
 
-    # check 3: if input is an integer
+    # check 3: if input is a date or a list of integers
+    ids, d = None, None
     try:
-        id = int(tokens[1])
-    except:
-        print("Please input a valid appointment ID!")
-        return
-
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-
-    # execute the cancelation for patient
-    if current_caregiver is None and current_patient is not None:
-        selected = "SELECT * FROM Appointments WHERE (Pusername = %s AND Id = %d)"
-        name = current_patient.username
+        d = datetime.datetime.strptime(tokens[1], "%m-%d-%Y")
+    except ValueError:
         try:
-            cursor.execute(selected, (name, id))
-            if cursor.rowcount == 0:
-                print("Wrong ID, or you have nothing to cancel!")
-                return
-            else:
-                # Update the caregiver's availability
-                caregiver_avail = "SELECT Cusername, Time FROM Appointments WHERE (Pusername = %s AND Id = %d)"
-                try:
-                    cursor.execute(caregiver_avail, (name, id))
-                    for row in cursor:
-                        assigned_caregiver = row["Cusername"]
-                        date = row["Time"]
-                    add_availability(date, assigned_caregiver)
-                except:
-                    conn.rollback()
-                    print("Error occurred when updating availability")
-                    cm.close_connection()
-                    return
-
-                # Increase the vaccine dose
-                vacc = "SELECT Vname FROM Appointments WHERE (Pusername = %s AND Id = %d)"
-                try:
-                    cursor.execute(vacc, (name, id))
-                    for row in cursor:
-                        vname = row["Vname"]
-                    vaccines = get_vaccine()
-                except pymssql.Error:
-                    conn.rollback()
-                    print("Error occurred when deleting appointments")
-                    cm.close_connection()
-                    return
-
-                vaccine = Vaccine(vaccine_name=vname, available_doses=vaccines[vname]).get()
-                vaccine.increase_available_doses(num=1)
-
-                # Delete the appointment in DB
-                delete = "DELETE FROM Appointments WHERE (Pusername = %s AND Id = %d)"
-                try:
-                    cursor.execute(delete, (name, id))
-                    # you must call commit() to persist your data if you don't set autocommit to True
-                    conn.commit()
-                except pymssql.Error:
-                    conn.rollback()
-                    print("Error occurred when deleting appointments")
-                    cm.close_connection()
-                    return
-                print(f"Appointment {id} has been successfully canceled!")
-        except:
-            print("Error occurred when canceling appointments")
-            cm.close_connection()
+            ids = [int(id) for id in tokens[1].split(",")]
+        except ValueError:
+            print("Please input a valid appointment ID!")
             return
-    # execute the cancelation for caregiver
-    elif current_patient is None and current_caregiver is not None:
-        selected = "SELECT * FROM Appointments WHERE (Cusername = %s AND Id = %d)"
-        name = current_caregiver.username
-        try:
-            cursor.execute(selected, (name, id))
-            if cursor.rowcount == 0:
-                print("Wrong ID, or you have nothing to cancel!")
-                return
-            else:
-                # Update the caregiver's availability
-                caregiver_avail = "SELECT Cusername, Time FROM Appointments WHERE (Cusername = %s AND Id = %d)"
-                try:
-                    cursor.execute(caregiver_avail, (name, id))
-                    for row in cursor:
-                        assigned_caregiver = row["Cusername"]
-                        date = row["Time"]
-                    add_availability(date, assigned_caregiver)
-                except:
-                    conn.rollback()
-                    print("Error occurred when updating availability")
-                    cm.close_connection()
-                    return
-
-                # Increase the vaccine dose
-                vacc = "SELECT Vname FROM Appointments WHERE (Cusername = %s AND Id = %d)"
-                try:
-                    cursor.execute(vacc, (name, id))
-                    for row in cursor:
-                        vname = row["Vname"]
-                    vaccines = get_vaccine()
-                except pymssql.Error:
-                    conn.rollback()
-                    print("Error occurred when deleting appointments")
-                    cm.close_connection()
-                    return
-
-                vaccine = Vaccine(vaccine_name=vname, available_doses=vaccines[vname]).get()
-                vaccine.increase_available_doses(num=1)
-
-                # Delete the appointment in DB
-                delete = "DELETE FROM Appointments WHERE (Cusername = %s AND Id = %d)"
-                try:
-                    cursor.execute(delete, (name, id))
-                    # you must call commit() to persist your data if you don't set autocommit to True
-                    conn.commit()
-                except pymssql.Error:
-                    conn.rollback()
-                    print("Error occurred when deleting appointments")
-                    cm.close_connection()
-                    return
-                print(f"Appointment {id} has been successfully canceled!")
-        except pymssql.Error:
-            print("Error occurred when canceling appointments")
-            cm.close_connection()
+        # IDs are handed out by IdAllocator, anything outside its range cannot be an appointment
+        if any(id < 1 or id > MAX_ID for id in ids):
+            print("Please input a valid appointment ID!")
             return
-    else:
-        print("Error occurred, please try again!")
+
+    is_caregiver = state.caregiver is not None
+    name = state.caregiver.username if is_caregiver else state.patient.username
+    try:
+        result = Appointment.cancel(name, is_caregiver, ids=ids, d=d)
+    except DatabaseError:
+        print("Error occurred when canceling appointments")
         return
 
-    cm.close_connection()
+    if result.status is CancelStatus.CONFLICT:
+        print("Another cancellation changed these appointments at the same time, nothing was canceled, "
+              "please try again!")
+        return
+    if result.status is CancelStatus.NOT_FOUND:
+        print("Wrong ID, or you have nothing to cancel!")
+        if len(ids) > 1:
+            print("Not your appointment(s): " + ", ".join(str(id) for id in result.missing) + "; nothing was canceled")
+        return
+    canceled = result.canceled
+    if d is not None:
+        invalidate_schedule(d)
+        if is_caregiver:
+            mark_unavailable(d, name)
+            print(f"Your availability on {tokens[1]} has been withdrawn!")
+        if len(canceled) == 0:
+            print(f"You have no appointments on {tokens[1]}!")
+    for appointment in canceled:
+        invalidate_schedule(appointment.get_time())
+        if ids is not None or not is_caregiver:
+            mark_available(appointment.get_time(), appointment.get_caregiver())
+        print(f"Appointment {appointment.get_id()} has been successfully canceled!")
+    if len(canceled) > 0:
+        invalidate_vaccines()
 
 
 def add_doses(tokens):
     """This function adds the vaccine and corresponding doses into the database."""
+    state = current_state()
     # add_doses <vaccine> <number>
     # check 1: check if the current logged-in user is a caregiver
-    global current_caregiver
-    if current_caregiver is None:
+    if state.caregiver is None:
         print("Please login as a caregiver first!")
         return
 
@@ -731,7 +843,7 @@ def add_doses(tokens):
         except:
             print("Failed to get Vaccine!")
             return
-    except pymssql.Error:
+    except DatabaseError:
         print("Error occurred when adding doses")
         return
 
@@ -746,7 +858,7 @@ def add_doses(tokens):
             except:
                 print("Failed To Save")
                 return
-        except pymssql.Error:
+        except DatabaseError:
             print("Error occurred when adding doses")
             return
     else:
@@ -757,121 +869,267 @@ def add_doses(tokens):
             except:
                 print("Failed to increase available doses!")
                 return
-        except pymssql.Error:
+        except DatabaseError:
             print("Error occurred when adding doses")
             return
 
+    invalidate_vaccines()
     print("Doses updated!")
 
 
+def shard_vaccine(tokens):
+    """This function spreads a vaccine's doses over several rows, so that its bookings stop queuing on one row lock."""
+    state = current_state()
+    # shard_vaccine <vaccine> <shards>
+    # check 1: check if the current logged-in user is a caregiver
+    if state.caregiver is None:
+        print("Please login as a caregiver first!")
+        return
+
+    # check 2: the length for tokens need to be exactly 3 to include all information (with the operation name)
+    if len(tokens) != 3:
+        print("Please try again!")
+        return
+
+    # check 3: the number of shards is a positive integer, 1 merges the shards back into one row
+    try:
+        shards = int(tokens[2])
+    except ValueError:
+        print("Invalid input!")
+        return
+    if shards <= 0:
+        print("Invalid input!")
+        return
+
+    try:
+        Vaccine(tokens[1], 0).shard(shards)
+    except ValueError:
+        print("No such vaccine, please try again!")
+        return
+    print(f"Doses of {tokens[1]} spread over {shards} shard(s)!")
+
+
+def parse_show_options(arguments):
+    """
+    This internal method reads the optional arguments of show_appointments, in any order: "upcoming" or a first date
+    to start from, a second date to end at, an output format of text, json or csv, and "archived" to read the
+    archive of past appointments instead.
+    --------
+    Returns:
+    (start, end, output format, archived), or None after telling the user what is wrong
+    """
+    start, end, output_format, archived = None, None, "text", False
+    for argument in arguments:
+        if argument in ("text", "json", "csv"):
+            output_format = argument
+        elif argument == "archived":
+            archived = True
+        elif argument == "upcoming":
+            today = datetime.date.today()
+            start = datetime.datetime(today.year, today.month, today.day)
+        else:
+            try:
+                d = datetime.datetime.strptime(argument, "%m-%d-%Y")
+            except ValueError:
+                print("Wrong date format! Should be MM-DD-YYYY")
+                return None
+            if start is None:
+                start = d
+            elif end is None:
+                end = d
+            else:
+                print("Please try again!")
+                return None
+    return start, end, output_format, archived
+
+
 def show_appointments(tokens):
-    """This function shows the appointment(s) for the logged-in user."""
-    global current_caregiver
-    global current_patient
-    # check 1: the length for tokens need to be exactly 1 to include all information (with the operation name)
-    if len(tokens) != 1:
+    """This function shows the appointment(s) for the logged-in user, optionally within dates and as JSON or CSV."""
+    state = current_state()
+    # show_appointments [upcoming|from_date] [to_date] [text|json|csv] [archived]
+    # check 1: the length for tokens need to be at most 5 to include all information (with the operation name)
+    if len(tokens) > 5:
         print("Please try again!")
         return
 
     # check 2: if no one's already logged-in
-    if current_caregiver is None and current_patient is None:
+    if state.caregiver is None and state.patient is None:
         print("Please login first!")
         return
 
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor(as_dict=True)
-
-    # show the appointment if login user is a patient
-    if current_caregiver is None and current_patient is not None:
-        show = "SELECT Id, Cusername, Vname, Time FROM Appointments WHERE Pusername = %s"
-        name = current_patient.username
-        try:
-            cursor.execute(show, name)
-            if cursor.rowcount == 0:
-                print("You have not scheduled any appointments!")
-                return
-            else:
-                for row in cursor:
-                    id = row["Id"]
-                    cname = row["Cusername"]
-                    vname = row["Vname"]
-                    date = row["Time"]
-                    d = datetime.datetime.strftime(date, "%m-%d-%Y")
-                    print(f"Appointment ID: {id}, Caregiver's name: {cname}, Vaccine: {vname}, Date: {d}")
-        except pymssql.Error:
-            print("Error occurred when showing appointments")
-            cm.close_connection()
-            return
-    # show the appointment if login user is a caregiver
-    elif current_patient is None and current_caregiver is not None:
-        show = "SELECT Id, Pusername, Vname, Time FROM Appointments WHERE Cusername = %s"
-        name = current_caregiver.username
-        try:
-            cursor.execute(show, name)
-            if cursor.rowcount == 0:
-                print("There is no appointments for you!")
-                return
+    # check 3: the dates and the format are valid
+    options = parse_show_options(tokens[1:])
+    if options is None:
+        return
+    start, end, output_format, archived = options
+
+    # a caregiver sees the patients' names, a patient the caregivers'
+    is_caregiver = state.caregiver is not None
+    name = state.caregiver.username if is_caregiver else state.patient.username
+    other = "patient" if is_caregiver else "caregiver"
+
+    # the appointments are printed as the pages arrive, never holding the whole history in memory
+    writer = None
+    if output_format == "csv":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(["id", other, "vaccine", "date"])
+    found = False
+    try:
+        for appointment in Appointment.iter_appointments(name, is_caregiver, start, end, archived=archived):
+            found = True
+            other_name = appointment.get_patient() if is_caregiver else appointment.get_caregiver()
+            d = datetime.datetime.strftime(appointment.get_time(), "%m-%d-%Y")
+            if output_format == "json":
+                print(json.dumps({"id": appointment.get_id(), other: other_name,
+                                  "vaccine": appointment.get_vaccine_name(), "date": d}))
+            elif output_format == "csv":
+                writer.writerow([appointment.get_id(), other_name, appointment.get_vaccine_name(), d])
+            elif is_caregiver:
+                print(f"Appointment ID: {appointment.get_id()}, Patient's name: {other_name}, "
+                      f"Vaccine: {appointment.get_vaccine_name()}, Date: {d}")
             else:
-                for row in cursor:
-                    id = row["Id"]
-                    pname = row["Pusername"]
-                    vname = row["Vname"]
-                    date = row["Time"]
-                    d = datetime.datetime.strftime(date, "%m-%d-%Y")
-                    print(f"Appointment ID: {id}, Patient's name: {pname}, Vaccine: {vname}, Date: {d}")
-        except pymssql.Error:
-            print("Error occurred when showing appointments")
-            cm.close_connection()
-            return
-    else:
-        print("Error occurred, please try again!")
+                print(f"Appointment ID: {appointment.get_id()}, Caregiver's name: {other_name}, "
+                      f"Vaccine: {appointment.get_vaccine_name()}, Date: {d}")
+    except DatabaseError:
+        print("Error occurred when showing appointments")
         return
 
-    cm.close_connection()
+    if not found and output_format == "text":
+        if is_caregiver:
+            print("There is no appointments for you!")
+        else:
+            print("You have not scheduled any appointments!")
 
 
 def logout(tokens):
     """This function logs out the current logged-in user."""
-    global current_patient
-    global current_caregiver
+    state = current_state()
     # check 1: the length for tokens need to be exactly 1 to include all information (with the operation name)
     if len(tokens) != 1:
         print("Please try again!")
         return
 
     # check 2: if no one's already logged-in
-    if current_caregiver is None and current_patient is None:
+    if state.caregiver is None and state.patient is None:
         print("No one logged-in!")
         return
     else:
-        current_patient = None
-        current_caregiver = None
+        state.patient = None
+        state.caregiver = None
+        if state.token is not None:
+            sessions.revoke(state.token)
+            state.token = None
 
     # check 3: if the logout was successful
-    if current_caregiver is not None or current_patient is not None:
+    if state.caregiver is not None or state.patient is not None:
         print("Please try again!")
     else:
         print("Logged-out!")
 
 
+def migrate_schema():
+    """This function applies the pending schema migrations and verifies the result."""
+    backend = ConnectionManager.get_backend()
+    backend.initialize()
+    applied = Migrator(backend).migrate()
+    if len(applied) == 0:
+        print("Schema is already up to date")
+    else:
+        print("Applied migrations: " + ", ".join(str(version) for version in applied))
+    return verify_schema()
+
+
+def verify_schema():
+    """This function checks that the live schema matches the expected version, returns True if it does."""
+    backend = ConnectionManager.get_backend()
+    backend.initialize()
+    migrator = Migrator(backend)
+    problems = migrator.verify()
+    if len(problems) == 0:
+        print(f"Schema is at the expected version {migrator.get_latest_version()}")
+        return True
+    for problem in problems:
+        print(problem)
+    return False
+
+
+def run_retention():
+    """This function archives past appointments and purges past availabilities once, in throttled batches."""
+    retention = Retention.from_env()
+    try:
+        archived, purged = retention.run_once()
+    except DatabaseError as db_err:
+        print("Error occurred when archiving appointments: " + str(db_err))
+        return False
+    print(f"Archived {archived} appointment(s) and purged {purged} availability(ies) "
+          f"before {retention.get_cutoff().strftime('%m-%d-%Y')}")
+    return True
+
+
+def rebuild_capacity():
+    """This function recounts the DailyCapacity summary from the Availabilities and Appointments tables."""
+    try:
+        repaired = DailyCapacity.rebuild()
+    except DatabaseError as db_err:
+        print("Error occurred when rebuilding daily capacity: " + str(db_err))
+        return False
+    print(f"Daily capacity rebuilt, {repaired} day(s) repaired")
+    return True
+
+
+# every command the prompt understands, with the arguments shown in the menu
+COMMANDS = {
+    "create_patient": (create_patient, "<username> <password>"),
+    "create_caregiver": (create_caregiver, "<username> <password>"),
+    "login_patient": (login_patient, "<username> <password>"),
+    "login_caregiver": (login_caregiver, "<username> <password>"),
+    "login_token": (login_token, "<token>"),
+    "search_caregiver_schedule": (search_caregiver_schedule, "<date>"),
+    "search_caregiver_schedule_range": (search_caregiver_schedule_range, "<start_date> <end_date>"),
+    "reserve": (reserve, "<date> <vaccine>"),
+    "find_next_slot": (find_next_slot, "<vaccine> [from_date]"),
+    "reserve_next_slot": (reserve_next_slot, "<vaccine> [from_date]"),
+    "upload_availability": (upload_availability, "<date>"),
+    "upload_availability_range": (upload_availability_range, "<start_date> <end_date> <days>"),
+    "cancel": (cancel, "<appointment_id[,appointment_id...]|date>"),
+    "add_doses": (add_doses, "<vaccine> <number>"),
+    "shard_vaccine": (shard_vaccine, "<vaccine> <shards>"),
+    "show_appointments": (show_appointments, "[upcoming|from_date] [to_date] [text|json|csv] [archived]"),
+    "logout": (logout, ""),
+}
+
+
+def parse(response):
+    """This function turns one line typed at the prompt into the tokens of a command."""
+    response = response.lower()
+    return response.split(" ")
+
+
+def execute(tokens):
+    """This function runs the command in the given tokens, returns False once the user quits."""
+    if len(tokens) == 0:
+        ValueError("Try Again")
+        return True
+    operation = tokens[0]
+    if operation in COMMANDS:
+        with metrics.command(operation):
+            COMMANDS[operation][0](tokens)
+    elif operation == "quit":
+        print("Thank you for using the scheduler, Goodbye!")
+        return False
+    else:
+        print("Invalid Argument")
+    return True
+
+
 def start():
     """Execute the functions."""
     stop = False
     while not stop:
         print()
         print(" *** Please enter one of the following commands *** ")
-        print("> create_patient <username> <password>")
-        print("> create_caregiver <username> <password>")
-        print("> login_patient <username> <password>")
-        print("> login_caregiver <username> <password>")
-        print("> search_caregiver_schedule <date>")
-        print("> reserve <date> <vaccine>")
-        print("> upload_availability <date>")
-        print("> cancel <appointment_id>")
-        print("> add_doses <vaccine> <number>")
-        print("> show_appointments")
-        print("> logout")
+        for operation, (command, arguments) in COMMANDS.items():
+            print(f"> {operation} {arguments}".rstrip())
         print("> Quit")
         print()
         response = ""
@@ -883,39 +1141,7 @@ def start():
             print("Type in a valid argument")
             break
 
-        response = response.lower()
-        tokens = response.split(" ")
-        if len(tokens) == 0:
-            ValueError("Try Again")
-            continue
-        operation = tokens[0]
-        if operation == "create_patient":
-            create_patient(tokens)
-        elif operation == "create_caregiver":
-            create_caregiver(tokens)
-        elif operation == "login_patient":
-            login_patient(tokens)
-        elif operation == "login_caregiver":
-            login_caregiver(tokens)
-        elif operation == "search_caregiver_schedule":
-            search_caregiver_schedule(tokens)
-        elif operation == "reserve":
-            reserve(tokens)
-        elif operation == "upload_availability":
-            upload_availability(tokens)
-        elif operation == "cancel":
-            cancel(tokens)
-        elif operation == "add_doses":
-            add_doses(tokens)
-        elif operation == "show_appointments":
-            show_appointments(tokens)
-        elif operation == "logout":
-            logout(tokens)
-        elif operation == "quit":
-            print("Thank you for using the scheduler, Goodbye!")
-            stop = True
-        else:
-            print("Invalid Argument")
+        stop = not execute(parse(response))
 
 
 if __name__ == "__main__":
@@ -926,6 +1152,26 @@ if __name__ == "__main__":
     // and then construct a map of vaccineName -> vaccineObject
     '''
 
+    parser = argparse.ArgumentParser(description="COVID-19 Vaccine Reservation Scheduling Application")
+    parser.add_argument("mode", nargs="?", default="interactive",
+                        choices=["interactive", "migrate", "verify_schema", "retention", "rebuild_capacity"],
+                        help="interactive prompt (default), apply schema migrations, verify the live schema, "
+                             "archive past appointments and purge past availabilities, "
+                             "or recount the daily capacity summary")
+    args = parser.parse_args()
+    if args.mode == "migrate":
+        sys.exit(0 if migrate_schema() else 1)
+    elif args.mode == "verify_schema":
+        sys.exit(0 if verify_schema() else 1)
+    elif args.mode == "retention":
+        ok = run_retention()
+        ConnectionManager.close_pool()
+        sys.exit(0 if ok else 1)
+    elif args.mode == "rebuild_capacity":
+        ok = rebuild_capacity()
+        ConnectionManager.close_pool()
+        sys.exit(0 if ok else 1)
+
     # start command line
     print()
     print("Welcome to the COVID-19 Vaccine Reservation Scheduling Application!")
@@ -0,0 +1,150 @@
+"""This module serves the vaccine scheduler commands to many clinic terminals at once over a local socket."""
+from concurrent.futures import ThreadPoolExecutor
+from db.ConnectionManager import ConnectionManager
+from db.Retention import Retention
+from util import Output
+from util.Metrics import metrics
+import Scheduler
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+
+
+class SchedulerServer:
+    """
+    An asyncio server speaking a line-based protocol: a client sends one command per line, either exactly as typed at
+    the interactive prompt ("reserve 10-10-2026 pfizer") or as a JSON object {"command": "...", "id": ...}, and gets
+    back one JSON line {"id": ..., "command": ..., "output": [...]} with whatever the prompt would have printed.
+    Every connection has its own login state; commands run on a bounded pool of worker threads, which borrow
+    database connections from the shared pool, so the event loop never blocks on the database.
+    --------
+    Parameters:
+    workers: the number of commands executed at the same time across all clients
+    """
+
+    def __init__(self, workers=32):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="command")
+        self.clients = 0
+
+    @staticmethod
+    def decode(line):
+        # returns the request id, if any, and the command tokens
+        line = line.strip()
+        if line.startswith("{"):
+            request = json.loads(line)
+            return request.get("id"), Scheduler.parse(str(request.get("command", "")))
+        return None, Scheduler.parse(line)
+
+    @staticmethod
+    def run_command(tokens):
+        with Output.capture() as lines:
+            try:
+                keep_going = Scheduler.execute(tokens)
+            except Exception as err:
+                # one failing command must not drop the client's connection; metrics.command() has counted it
+                print("Command failed: " + type(err).__name__ + ", please try again!")
+                keep_going = True
+        return keep_going, lines
+
+    async def handle(self, reader, writer):
+        # this task runs in its own context, so the login state set here belongs to this client only
+        Scheduler.login_state.set(Scheduler.LoginState())
+        loop = asyncio.get_running_loop()
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request_id, tokens = self.decode(line.decode("utf-8"))
+                except ValueError:
+                    writer.write(json.dumps({"id": None, "error": "Malformed request"}).encode("utf-8") + b"\n")
+                    await writer.drain()
+                    continue
+
+                context = contextvars.copy_context()
+                keep_going, output = await loop.run_in_executor(self.executor, context.run, self.run_command, tokens)
+                response = {"id": request_id, "command": tokens[0], "output": output}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+                if not keep_going:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    @staticmethod
+    async def handle_metrics(reader, writer):
+        # a minimal HTTP endpoint: GET /metrics in the Prometheus text format, GET /metrics.json as JSON
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            target = request[1] if len(request) > 1 else "/"
+            if target == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", metrics.to_prometheus()
+            elif target == "/metrics.json":
+                status, content_type, body = "200 OK", "application/json", json.dumps(metrics.snapshot())
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "Not found\n"
+            body = body.encode("utf-8")
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None, path=None, metrics_port=None):
+        Output.install()
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+        if metrics_port is not None:
+            metrics_host = host or "127.0.0.1"
+            await asyncio.start_server(self.handle_metrics, host=metrics_host, port=metrics_port)
+            print(f"Serving metrics on http://{metrics_host}:{metrics_port}/metrics")
+        async with server:
+            for sock in server.sockets:
+                print(f"Serving the vaccine scheduler on {sock.getsockname()}")
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+        ConnectionManager.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the vaccine scheduler commands over a local socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="listen on this unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("ServerWorkers", "32")),
+                        help="commands executed at the same time across all clients")
+    parser.add_argument("--retention-interval", type=float, default=os.getenv("RetentionInterval"),
+                        help="archive past appointments and purge past availabilities every this many seconds")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve the metrics over HTTP on this port, at /metrics and /metrics.json")
+    args = parser.parse_args()
+
+    scheduler_server = SchedulerServer(workers=args.workers)
+    retention = None
+    if args.retention_interval is not None:
+        retention = Retention.from_env()
+        retention.start(float(args.retention_interval))
+    try:
+        asyncio.run(scheduler_server.serve(host=args.host, port=args.port, path=args.unix,
+                                            metrics_port=args.metrics_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if retention is not None:
+            retention.stop()
+        scheduler_server.close()
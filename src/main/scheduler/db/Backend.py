@@ -0,0 +1,63 @@
+class Backend:
+    """
+    Base class of the storage engines the ConnectionManager can pool connections for.
+    Every engine hands out DB-API connections whose cursor(as_dict=True) yields rows as dictionaries and
+    accepts the %s / %d placeholders used throughout the models, so the SQL in the models stays engine-agnostic.
+    """
+    name = None
+    # the engine's DB-API exception classes, None if its driver is not installed
+    Error = None
+    OperationalError = None
+    # whether several statements with variables and control flow can go to the server as one batch
+    supports_batches = False
+
+    def connect(self):
+        raise NotImplementedError
+
+    def initialize(self):
+        """Prepare the database before the first connection is handed out."""
+        pass
+
+    def close(self):
+        pass
+
+    # savepoints, used by db/SharedConnection.py
+    def savepoint_sql(self, name):
+        return "SAVEPOINT " + name
+
+    def rollback_to_savepoint_sql(self, name):
+        return "ROLLBACK TO SAVEPOINT " + name
+
+    # row limits
+    def limit_sql(self, sql, count):
+        """Return the SELECT statement sql limited to its first count rows."""
+        return sql + " LIMIT " + str(int(count))
+
+    def lock_hint_sql(self):
+        """
+        Return the table hint that makes a read inside a transaction hold its key-range lock until commit,
+        so an insert guarded by NOT EXISTS cannot race another one; empty where writers are serialized anyway.
+        """
+        return ""
+
+    def random_sql(self):
+        """Return the expression that orders rows randomly, as in ORDER BY RANDOM()."""
+        return "RANDOM()"
+
+    # schema management, used by db/Migrator.py
+    def execute_script(self, conn, script):
+        """Run a multi-statement SQL script inside the connection's transaction."""
+        raise NotImplementedError
+
+    def list_tables(self, conn):
+        """Return the lower-cased names of all tables in the database."""
+        raise NotImplementedError
+
+    def list_indexes(self, conn):
+        """Return the lower-cased names of all named indexes in the database."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _names(cursor, sql):
+        cursor.execute(sql)
+        return {row[0].lower() for row in cursor.fetchall()}
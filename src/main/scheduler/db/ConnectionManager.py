@@ -1,51 +1,149 @@
-import pymssql
+import contextvars
 import os
+import threading
+import time
+from contextlib import contextmanager
+from db.ConnectionPool import ConnectionPool, PoolTimeoutError
+from db.InstrumentedConnection import InstrumentedConnection, error_code
+from db.Migrator import Migrator
+from db.QueryTracer import tracer
+from db.SharedConnection import SharedConnection
+from db.MssqlBackend import MssqlBackend
+from db.SqliteBackend import SqliteBackend
+from util.Metrics import metrics
+
+# storage engines selectable with the DBBackend environment variable
+BACKENDS = {
+    MssqlBackend.name: MssqlBackend,
+    SqliteBackend.name: SqliteBackend,
+}
+
+# exception classes raised by any of the storage engines, for use in except clauses
+DatabaseError = tuple(backend.Error for backend in BACKENDS.values() if backend.Error is not None)
+
+# the connection every ConnectionManager in the current context uses instead of the pool, see ConnectionManager.shared()
+shared_connection = contextvars.ContextVar("shared_connection", default=None)
 
 
 class ConnectionManager:
+    # one backend and one pool shared by every ConnectionManager in the process
+    _backend = None
+    _pool = None
+    _pool_lock = threading.Lock()
 
     def __init__(self):
-        self.server_name = os.getenv("Server")
-        self.db_name = os.getenv("DBName")
-        self.user = os.getenv("UserID")
-        self.password = os.getenv("Password")
         self.conn = None
+        self.borrowed = False
+
+    @classmethod
+    def get_backend(cls):
+        if cls._backend is None:
+            name = os.getenv("DBBackend", MssqlBackend.name).lower()
+            if name not in BACKENDS:
+                raise ValueError("Unknown database backend: " + name)
+            cls._backend = BACKENDS[name]()
+        return cls._backend
+
+    @classmethod
+    def get_pool(cls):
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    backend = cls.get_backend()
+                    backend.initialize()
+                    # bring the schema up to date before anyone can run a query against it
+                    if os.getenv("AutoMigrate", "1") != "0":
+                        Migrator(backend).migrate()
+                    connect = backend.connect
+                    if os.getenv("Metrics", "1") != "0" or tracer.is_enabled():
+                        # time every statement, count the statements, rows and errors of every command,
+                        # and log the slow ones
+                        connect = lambda: InstrumentedConnection(backend.connect())
+                    cls._pool = ConnectionPool(
+                        connect,
+                        max_size=int(os.getenv("PoolSize", "10")),
+                        timeout=float(os.getenv("PoolTimeout", "30")),
+                        idle_timeout=float(os.getenv("PoolIdleTimeout", "300")),
+                        max_lifetime=float(os.getenv("PoolMaxLifetime", "1800"))
+                    )
+                    metrics.gauge("db_pool_connections", cls._pool.get_size)
+                    metrics.gauge("db_pool_idle_connections", cls._pool.get_idle_count)
+        return cls._pool
+
+    @classmethod
+    def close_pool(cls):
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.close()
+                cls._pool = None
+            if cls._backend is not None:
+                cls._backend.close()
+                cls._backend = None
+
+    @classmethod
+    @contextmanager
+    def shared(cls):
+        """
+        Run a group of commands on one pooled connection in one transaction, committed when the with-block exits
+        and rolled back if it raises. Yields the SharedConnection, whose begin_command() starts each command.
+        """
+        pool = cls.get_pool()
+        conn = pool.acquire()
+        shared = SharedConnection(conn, cls.get_backend())
+        reset_token = shared_connection.set(shared)
+        try:
+            yield shared
+            shared.commit_group()
+        except BaseException:
+            shared.rollback_group()
+            raise
+        finally:
+            shared_connection.reset(reset_token)
+            pool.release(conn)
 
     def create_connection(self):
+        shared = shared_connection.get()
+        if shared is not None:
+            self.conn = shared
+            self.borrowed = True
+            return self.conn
+        started = time.perf_counter()
         try:
-            self.conn = pymssql.connect(server=self.server_name, user=self.user, password=self.password, database=self.db_name)
-        except pymssql.Error as db_err:
+            self.conn = self.get_pool().acquire()
+        except DatabaseError as db_err:
+            metrics.inc("db_connect_errors_total", {"code": error_code(db_err)})
             print("Database Programming Error in SQL connection processing! ")
             sqlrc = str(db_err.args[0])
             print("Exception code: " + str(sqlrc))
+        except PoolTimeoutError as pool_err:
+            metrics.inc("db_pool_timeouts_total")
+            print("Database connection pool exhausted! " + str(pool_err))
+        metrics.observe("db_connection_acquire_seconds", time.perf_counter() - started)
         return self.conn
 
     def close_connection(self):
+        # hand the connection back to the pool instead of tearing it down
+        if self.conn is None:
+            return
+        if self.borrowed:
+            self.conn = None
+            self.borrowed = False
+            return
         try:
-            self.conn.close()
-        except pymssql.Error as db_err:
+            self.get_pool().release(self.conn)
+        except DatabaseError as db_err:
             print("Database Programming Error in SQL connection processing! ")
             sqlrc = str(db_err.args[0])
             print("Exception code: " + str(sqlrc))
+        self.conn = None
+
+    # with ConnectionManager() as conn: borrows a pooled connection for the block
+    def __enter__(self):
+        conn = self.create_connection()
+        if conn is None:
+            raise self.get_backend().OperationalError("Could not obtain a database connection")
+        return conn
 
-# cm = ConnectionManager()
-# conn = cm.create_connection()
-# cursor = conn.cursor()
-
-# # example 1: getting all names and available doses in the vaccine table
-# get_all_vaccines = "SELECT Name, Doses FROM vaccines"
-# try:
-#     cursor.execute(get_all_vaccines)
-#     for row in cursor:
-#         print("name:" + str(row['Name']) + ", available_doses: " + str(row['Doses']))
-# except pymssql.Error:
-#     print("Error occurred when getting details from Vaccines")
-
-# # example 2: getting all records where the name matches “Pfizer”
-# get_pfizer = "SELECT * FROM vaccine WHERE name = %s"
-# try:
-#     cursor.execute(get_pfizer)
-#     for row in cursor:
-#         print("name:" + str(row['Name']) + ", available_doses: " + str(row['Doses']))
-# except pymssql.Error:
-#     print("Error occurred when getting pfizer from Vaccines")
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_connection()
+        return False
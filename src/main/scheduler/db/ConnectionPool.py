@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out before the pool timeout expired."""
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of database connections.
+    --------
+    Parameters:
+    connect: callable returning a new DB-API connection
+    max_size: the maximum number of connections open at the same time
+    timeout: seconds to wait for a free connection before raising PoolTimeoutError
+    idle_timeout: seconds an idle connection may sit in the pool before it is closed
+    max_lifetime: seconds after which a connection is closed instead of being reused
+    ping_interval: idle seconds after which a connection is health-checked before checkout
+    """
+
+    def __init__(self, connect, max_size=10, timeout=30, idle_timeout=300, max_lifetime=1800, ping_interval=30):
+        if max_size <= 0:
+            raise ValueError("Pool size must be positive!")
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+    # getters
+    def get_size(self):
+        return self._size
+
+    def get_idle_count(self):
+        return len(self._idle)
+
+    def acquire(self):
+        """Check a connection out of the pool, opening a new one if the pool is not full yet."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                self._evict_idle()
+                entry = self._idle.pop() if self._idle else None
+                if entry is None and self._size < self.max_size:
+                    self._size += 1
+                    reserved = True
+                else:
+                    reserved = False
+                if entry is None and not reserved:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError("Timed out waiting for a database connection")
+                    self._cond.wait(remaining)
+                    continue
+
+            if reserved:
+                try:
+                    entry = _PooledConnection(self.connect())
+                except BaseException:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(entry):
+                self._discard(entry)
+                continue
+
+            entry.last_used = time.monotonic()
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+            return entry.conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any transaction left open by the borrower."""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            return
+
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        now = time.monotonic()
+        if discard or self._closed or now - entry.created_at >= self.max_lifetime:
+            self._discard(entry)
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with-block."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def _evict_idle(self):
+        # called with the lock held; the least recently used connections sit at the left end
+        now = time.monotonic()
+        while self._idle:
+            entry = self._idle[0]
+            if now - entry.last_used < self.idle_timeout and now - entry.created_at < self.max_lifetime:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._close_quietly(entry.conn)
+
+    def _is_healthy(self, entry):
+        if time.monotonic() - entry.last_used < self.ping_interval:
+            return True
+        try:
+            cursor = entry.conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, entry):
+        self._close_quietly(entry.conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
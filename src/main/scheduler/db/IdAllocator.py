@@ -0,0 +1,71 @@
+import threading
+from db.ConnectionManager import ConnectionManager
+from db.ConnectionManager import DatabaseError
+from db.SharedConnection import SharedConnection
+
+MAX_ID = 2 ** 63 - 1
+
+
+class IdAllocator:
+    """
+    Hands out unique 64-bit IDs for a table without asking the database whether an ID is taken.
+    Each process reserves a block of IDs at a time by bumping a counter in the Sequences table, then serves the
+    block from memory, so only one booking in every block_size touches the database for its ID.
+    --------
+    Parameters:
+    name: the row of the Sequences table that holds the counter
+    table, column: the table and column the IDs are used in, to seed the counter past any existing ID
+    block_size: how many IDs one process reserves per round trip
+    """
+
+    def __init__(self, name, table, column, block_size=100):
+        if block_size <= 0:
+            raise ValueError("Block size must be positive!")
+        self.name = name
+        self.table = table
+        self.column = column
+        self.block_size = block_size
+        self.next_value = 0
+        self.block_end = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            if self.next_value >= self.block_end:
+                self.next_value, self.block_end = self._reserve_block()
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+    def reset(self):
+        """Drop the rest of the current block; the next ID reserves a fresh one."""
+        with self.lock:
+            self.next_value = self.block_end = 0
+
+    def _reserve_block(self):
+        bump = "UPDATE Sequences SET NextValue = NextValue + %d WHERE Name = %s"
+        get_value = "SELECT NextValue FROM Sequences WHERE Name = %s"
+        seed = f"INSERT INTO Sequences SELECT %s, COALESCE(MAX({self.column}), 0) + 1 + %d FROM {self.table}"
+
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            for attempt in range(2):
+                cursor.execute(bump, (self.block_size, self.name))
+                if cursor.rowcount == 0:
+                    # first block ever for this sequence; another process may seed it at the same time
+                    try:
+                        cursor.execute(seed, (self.name, self.block_size))
+                    except DatabaseError:
+                        conn.rollback()
+                        continue
+                cursor.execute(get_value, self.name)
+                end = cursor.fetchone()["NextValue"]
+                conn.commit()
+                if isinstance(conn, SharedConnection):
+                    # inside a batch the bump commits with the batch, so forget the block if the command
+                    # that made the bump, or the whole batch, is rolled back
+                    conn.on_rollback(self.reset)
+                if end > MAX_ID:
+                    raise OverflowError("ID space of sequence " + self.name + " is exhausted")
+                return end - self.block_size, end
+        raise RuntimeError("Could not reserve IDs for sequence " + self.name)
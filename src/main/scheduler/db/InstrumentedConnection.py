@@ -0,0 +1,107 @@
+import re
+import time
+from db.QueryTracer import tracer
+from util.Metrics import metrics, current_command
+
+# a list of placeholders, as in IN (%s, %s, %s), whose length depends on the data
+PLACEHOLDER_LIST = re.compile(r"%[sd](\s*,\s*%[sd])+")
+
+
+def fingerprint(sql):
+    """Return the shape of a statement: whitespace collapsed and placeholder lists shortened, for use as a label."""
+    return PLACEHOLDER_LIST.sub("%s, ...", " ".join(sql.split()))
+
+
+def error_code(err):
+    # SQL Server errors carry their number first; SQLite errors only have a message
+    code = err.args[0] if len(err.args) > 0 else None
+    return str(code) if isinstance(code, int) else type(err).__name__
+
+
+class InstrumentedCursor:
+    """
+    Wraps a DB-API cursor, timing every statement and counting the statements, rows and errors of each command.
+    Slow and sampled statements also go to the query tracer, see db/QueryTracer.py.
+    """
+
+    def __init__(self, cursor):
+        self.wrapped = cursor
+
+    def _run(self, method, sql, params, traced_params):
+        statement = fingerprint(sql)
+        command = current_command.get()
+        started = time.perf_counter()
+        try:
+            method(sql, *params)
+        except Exception as err:
+            seconds = time.perf_counter() - started
+            metrics.inc("db_errors_total", {"command": command, "code": error_code(err)})
+            tracer.record(statement, traced_params, seconds, None, command, error=error_code(err))
+            raise
+        finally:
+            metrics.observe("db_query_seconds", time.perf_counter() - started, {"statement": statement})
+            metrics.inc("db_queries_total", {"command": command})
+        # SELECTs report no row count until their rows are fetched
+        rowcount = self.wrapped.rowcount
+        if rowcount is None or rowcount < 0:
+            rowcount = None
+        elif rowcount > 0:
+            metrics.inc("db_rows_written_total", {"command": command}, rowcount)
+        tracer.record(statement, traced_params, time.perf_counter() - started, rowcount, command)
+
+    def execute(self, sql, *args):
+        self._run(self.wrapped.execute, sql, args, args[0] if len(args) > 0 else None)
+        return self
+
+    def executemany(self, sql, *args):
+        # the parameters of a bulk insert are too many to trace, only their statement is
+        self._run(self.wrapped.executemany, sql, args, None)
+        return self
+
+    def _read(self, rows):
+        metrics.inc("db_rows_read_total", {"command": current_command.get()}, rows)
+
+    def fetchone(self):
+        row = self.wrapped.fetchone()
+        if row is not None:
+            self._read(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self.wrapped.fetchmany(*args)
+        self._read(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.wrapped.fetchall()
+        self._read(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self.wrapped:
+            self._read(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class InstrumentedConnection:
+    """Wraps a pooled DB-API connection so that its cursors are instrumented and its transactions counted."""
+
+    def __init__(self, conn):
+        self.wrapped = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.wrapped.cursor(*args, **kwargs))
+
+    def commit(self):
+        metrics.inc("db_transactions_total", {"command": current_command.get(), "outcome": "commit"})
+        return self.wrapped.commit()
+
+    def rollback(self):
+        metrics.inc("db_transactions_total", {"command": current_command.get(), "outcome": "rollback"})
+        return self.wrapped.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
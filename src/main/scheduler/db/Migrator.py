@@ -0,0 +1,150 @@
+import datetime
+import hashlib
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "resources", "migrations")
+
+# 001_initial_schema.sql, or 001_initial_schema.mssql.sql for a script that only applies to one backend
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+?)(?:\.(\w+))?\.sql$")
+CREATED_OBJECT = re.compile(r"CREATE\s+(?:UNIQUE\s+)?(TABLE|INDEX)\s+(\w+)", re.IGNORECASE)
+
+create_version_table = """CREATE TABLE SchemaVersion (
+    Version int,
+    Name varchar(255),
+    Checksum varchar(64),
+    AppliedAt varchar(32),
+    PRIMARY KEY (Version)
+)"""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path) as f:
+            self.script = f.read()
+        self.checksum = hashlib.sha256(self.script.encode("utf-8")).hexdigest()
+
+    def created_objects(self):
+        """Return the (kind, lower-cased name) pairs of the tables and indexes this migration creates."""
+        return {(kind.upper(), name.lower()) for kind, name in CREATED_OBJECT.findall(self.script)}
+
+
+class Migrator:
+    """
+    Versioned schema migrations for the scheduler database.
+    Migrations are the numbered .sql files in resources/migrations, applied in order, each in its own transaction,
+    and recorded in the SchemaVersion table. A file named NNN_name.<backend>.sql replaces NNN_name.sql on that backend.
+    --------
+    Parameters:
+    backend: the Backend to migrate; connections are opened directly, outside the pool
+    """
+
+    def __init__(self, backend, migrations_dir=MIGRATIONS_DIR):
+        self.backend = backend
+        self.migrations_dir = migrations_dir
+
+    def get_migrations(self):
+        generic = {}
+        specific = {}
+        for file_name in os.listdir(self.migrations_dir):
+            match = MIGRATION_FILE.match(file_name)
+            if match is None:
+                continue
+            version, name, backend_name = int(match.group(1)), match.group(2), match.group(3)
+            migration = Migration(version, name, os.path.join(self.migrations_dir, file_name))
+            if backend_name is None:
+                generic[version] = migration
+            elif backend_name == self.backend.name:
+                specific[version] = migration
+        generic.update(specific)
+        return [generic[version] for version in sorted(generic)]
+
+    def get_latest_version(self):
+        migrations = self.get_migrations()
+        return migrations[-1].version if migrations else 0
+
+    def _applied(self, conn):
+        # version -> checksum of every migration recorded in SchemaVersion
+        cursor = conn.cursor(as_dict=True)
+        cursor.execute("SELECT Version, Checksum FROM SchemaVersion")
+        return {row["Version"]: row["Checksum"] for row in cursor.fetchall()}
+
+    def _record(self, conn, migration):
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO SchemaVersion VALUES (%d, %s, %s, %s)",
+                       (migration.version, migration.name, migration.checksum,
+                        datetime.datetime.utcnow().isoformat(timespec="seconds")))
+
+    def _ensure_version_table(self, conn, migrations):
+        tables = self.backend.list_tables(conn)
+        if "schemaversion" in tables:
+            return
+        cursor = conn.cursor()
+        cursor.execute(create_version_table)
+        # a database set up by hand from the original create.sql is adopted as version 1
+        if "caregivers" in tables and migrations and migrations[0].version == 1:
+            self._record(conn, migrations[0])
+        conn.commit()
+
+    def migrate(self):
+        """
+        Apply every migration newer than the database's current version.
+        --------
+        Returns:
+        applied: a list of the versions applied by this call
+        """
+        migrations = self.get_migrations()
+        applied = []
+        conn = self.backend.connect()
+        try:
+            self._ensure_version_table(conn, migrations)
+            done = self._applied(conn)
+            for migration in migrations:
+                if migration.version in done:
+                    continue
+                try:
+                    self.backend.execute_script(conn, migration.script)
+                    self._record(conn, migration)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(migration.version)
+        finally:
+            conn.close()
+        return applied
+
+    def verify(self):
+        """
+        Check that the live schema matches the migrations on disk.
+        --------
+        Returns:
+        problems: a list of human-readable differences, empty if the schema is up to date
+        """
+        migrations = self.get_migrations()
+        problems = []
+        conn = self.backend.connect()
+        try:
+            tables = self.backend.list_tables(conn)
+            if "schemaversion" not in tables:
+                return ["SchemaVersion table is missing, the database has never been migrated"]
+            indexes = self.backend.list_indexes(conn)
+            done = self._applied(conn)
+            current = max(done) if done else 0
+            latest = migrations[-1].version if migrations else 0
+            if current != latest:
+                problems.append(f"Schema is at version {current}, expected version {latest}")
+            for migration in migrations:
+                if migration.version not in done:
+                    continue
+                if done[migration.version] != migration.checksum:
+                    problems.append(f"Migration {migration.version} ({migration.name}) was changed after it was applied")
+                for kind, name in sorted(migration.created_objects()):
+                    if name not in (tables if kind == "TABLE" else indexes):
+                        problems.append(f"{kind.capitalize()} {name} from migration {migration.version} is missing")
+        finally:
+            conn.close()
+        return problems
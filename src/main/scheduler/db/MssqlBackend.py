@@ -0,0 +1,51 @@
+import os
+from db.Backend import Backend
+try:
+    import pymssql
+except ImportError:
+    pymssql = None
+
+
+class MssqlBackend(Backend):
+    """Microsoft SQL Server / Azure SQL, reached through pymssql with the Server, DBName, UserID and Password settings."""
+    name = "mssql"
+    Error = pymssql.Error if pymssql is not None else None
+    OperationalError = pymssql.OperationalError if pymssql is not None else None
+    supports_batches = True
+
+    def __init__(self):
+        self.server_name = os.getenv("Server")
+        self.db_name = os.getenv("DBName")
+        self.user = os.getenv("UserID")
+        self.password = os.getenv("Password")
+
+    def connect(self):
+        if pymssql is None:
+            raise ImportError("pymssql is required for the mssql backend, run pip install -r requirements.txt")
+        return pymssql.connect(server=self.server_name, user=self.user, password=self.password, database=self.db_name)
+
+    def savepoint_sql(self, name):
+        return "SAVE TRANSACTION " + name
+
+    def rollback_to_savepoint_sql(self, name):
+        return "ROLLBACK TRANSACTION " + name
+
+    def limit_sql(self, sql, count):
+        return "SELECT TOP " + str(int(count)) + " " + sql[len("SELECT "):]
+
+    def lock_hint_sql(self):
+        return " WITH (UPDLOCK, HOLDLOCK)"
+
+    def random_sql(self):
+        return "NEWID()"
+
+    def execute_script(self, conn, script):
+        # T-SQL runs the whole script as one batch, so variables declared in a migration stay in scope
+        cursor = conn.cursor()
+        cursor.execute(script)
+
+    def list_tables(self, conn):
+        return self._names(conn.cursor(), "SELECT name FROM sys.tables")
+
+    def list_indexes(self, conn):
+        return self._names(conn.cursor(), "SELECT name FROM sys.indexes WHERE name IS NOT NULL")
@@ -0,0 +1,96 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+
+def redact(params):
+    """
+    Return the parameters of a statement in a form safe to log: numbers, dates and NULLs are kept,
+    while strings and bytes, which hold usernames, salts and hashes, are reduced to their type and length.
+    """
+    if params is None:
+        return None
+    if not isinstance(params, (tuple, list)):
+        params = (params,)
+    redacted = []
+    for value in params:
+        if value is None or isinstance(value, (bool, int, float)):
+            redacted.append(value)
+        elif isinstance(value, (datetime.date, datetime.datetime)):
+            redacted.append(value.isoformat())
+        else:
+            redacted.append(f"<{type(value).__name__}:{len(value) if hasattr(value, '__len__') else '?'}>")
+    return redacted
+
+
+def _rotating_logger(name, path, max_bytes, backups):
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+class QueryTracer:
+    """
+    Writes statements to log files as JSON lines: every statement slower than slow_threshold seconds to the
+    slow-query log, and a random sample_rate fraction of all statements to the trace file.
+    Both files rotate after max_bytes, keeping backups old files.
+    Each line has the statement's fingerprint, a short hash of it, the redacted parameters, the duration,
+    the row count and the command that ran it.
+    """
+
+    def __init__(self, slow_log=None, slow_threshold=0.2, trace_file=None, sample_rate=0.0,
+                 max_bytes=10 * 1024 * 1024, backups=5):
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.slow_logger = None
+        self.trace_logger = None
+        if slow_log is not None:
+            self.slow_logger = _rotating_logger("scheduler.slow_queries", slow_log, max_bytes, backups)
+        if trace_file is not None and sample_rate > 0:
+            self.trace_logger = _rotating_logger("scheduler.query_traces", trace_file, max_bytes, backups)
+
+    @classmethod
+    def from_env(cls):
+        return cls(slow_log=os.getenv("SlowQueryLog"),
+                   slow_threshold=float(os.getenv("SlowQueryMs", "200")) / 1000,
+                   trace_file=os.getenv("TraceFile"),
+                   sample_rate=float(os.getenv("TraceSampleRate", "0")),
+                   max_bytes=int(os.getenv("TraceLogBytes", str(10 * 1024 * 1024))),
+                   backups=int(os.getenv("TraceLogBackups", "5")))
+
+    def is_enabled(self):
+        return self.slow_logger is not None or self.trace_logger is not None
+
+    def record(self, statement, params, seconds, rows, command, error=None):
+        slow = self.slow_logger is not None and seconds >= self.slow_threshold
+        sampled = self.trace_logger is not None and random.random() < self.sample_rate
+        if not slow and not sampled:
+            return
+        line = json.dumps({
+            "time": time.time(),
+            "command": command,
+            "fingerprint": hashlib.sha1(statement.encode("utf-8")).hexdigest()[:12],
+            "statement": statement,
+            "params": redact(params),
+            "ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "error": error,
+        })
+        if slow:
+            self.slow_logger.info(line)
+        if sampled:
+            self.trace_logger.info(line)
+
+
+# the tracer of this process, configured by SlowQueryLog, SlowQueryMs, TraceFile, TraceSampleRate,
+# TraceLogBytes and TraceLogBackups
+tracer = QueryTracer.from_env()
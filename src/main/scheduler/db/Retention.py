@@ -0,0 +1,156 @@
+import datetime
+import os
+import threading
+from db.ConnectionManager import ConnectionManager
+from db.ConnectionManager import DatabaseError
+from model.DailyCapacity import DailyCapacity
+from util.Util import Util
+
+
+class Retention:
+    """
+    Keeps Appointments and Availabilities down to the days that still matter.
+    Appointments before the cutoff move to AppointmentsArchive and availabilities before it are deleted, in
+    transactions of at most batch_size rows with a pause in between, so the job never holds locks for long
+    and leaves room for the bookings running at the same time. Each transaction takes its rows off the
+    DailyCapacity counts as well, so the summary stays right however far a stopped run got.
+    --------
+    Parameters:
+    keep_days: how many past days stay in the hot tables, 0 keeps only today and later
+    batch_size: the number of rows moved or deleted per transaction
+    pause: seconds to sleep between two transactions
+    """
+
+    def __init__(self, keep_days=0, batch_size=500, pause=0.1):
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive!")
+        self.keep_days = keep_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.stopped = threading.Event()
+
+    @classmethod
+    def from_env(cls):
+        return cls(keep_days=int(os.getenv("RetentionDays", "0")),
+                   batch_size=int(os.getenv("RetentionBatch", "500")),
+                   pause=float(os.getenv("RetentionPause", "0.1")))
+
+    def get_cutoff(self, today=None):
+        """Return the first day that stays in the hot tables."""
+        today = today or datetime.date.today()
+        cutoff = today - datetime.timedelta(days=self.keep_days)
+        return datetime.datetime(cutoff.year, cutoff.month, cutoff.day)
+
+    def archive_appointments(self, cutoff):
+        """Move every appointment before cutoff to AppointmentsArchive, returning how many were moved."""
+        backend = ConnectionManager.get_backend()
+        get_batch = backend.limit_sql("SELECT Id, Time FROM Appointments WHERE Time < %s ORDER BY Time, Id",
+                                      self.batch_size)
+        moved = 0
+        while not self.stopped.is_set():
+            with ConnectionManager() as conn:
+                cursor = conn.cursor(as_dict=True)
+                try:
+                    cursor.execute(get_batch, cutoff)
+                    rows = cursor.fetchall()
+                    if len(rows) == 0:
+                        return moved
+                    ids = [row["Id"] for row in rows]
+                    id_list = ", ".join(["%d"] * len(ids))
+                    cursor.execute("INSERT INTO AppointmentsArchive SELECT Id, Cusername, Pusername, Vname, Time "
+                                   f"FROM Appointments WHERE Id IN ({id_list})", tuple(ids))
+                    cursor.execute(f"DELETE FROM Appointments WHERE Id IN ({id_list})", tuple(ids))
+                    if cursor.rowcount != len(ids):
+                        # a concurrent cancellation took some of them and adjusted their days; read the batch again
+                        conn.rollback()
+                        continue
+                    DailyCapacity.adjust(cursor, _per_day([row["Time"] for row in rows], (0, -1)))
+                    conn.commit()
+                except DatabaseError:
+                    conn.rollback()
+                    raise
+            moved += len(ids)
+            self.stopped.wait(self.pause)
+        return moved
+
+    def purge_availabilities(self, cutoff):
+        """Delete every availability before cutoff, returning how many were deleted."""
+        backend = ConnectionManager.get_backend()
+        get_batch = backend.limit_sql("SELECT Time, Username FROM Availabilities WHERE Time < %s ORDER BY Time",
+                                      self.batch_size)
+        delete = "DELETE FROM Availabilities WHERE (Time = %s AND Username = %s)"
+        purged = 0
+        while not self.stopped.is_set():
+            with ConnectionManager() as conn:
+                cursor = conn.cursor(as_dict=True)
+                try:
+                    cursor.execute(get_batch, cutoff)
+                    slots = [(row["Time"], row["Username"]) for row in cursor.fetchall()]
+                    if len(slots) == 0:
+                        return purged
+                    cursor.executemany(delete, slots)
+                    if cursor.rowcount != len(slots):
+                        # a concurrent booking claimed some of them and adjusted their days; read the batch again
+                        conn.rollback()
+                        continue
+                    DailyCapacity.adjust(cursor, _per_day([d for d, username in slots], (-1, 0)))
+                    conn.commit()
+                except DatabaseError:
+                    conn.rollback()
+                    raise
+            purged += len(slots)
+            self.stopped.wait(self.pause)
+        return purged
+
+    def purge_capacity(self, cutoff):
+        """Delete the DailyCapacity rows of the days before cutoff that the purge has counted down to zero."""
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute("DELETE FROM DailyCapacity WHERE Time < %s AND Available = 0 AND Booked = 0", cutoff)
+                conn.commit()
+            except DatabaseError:
+                conn.rollback()
+                raise
+
+    def run_once(self, today=None):
+        """
+        Archive and purge everything before the cutoff.
+        --------
+        Returns:
+        archived: the number of appointments moved to the archive
+        purged: the number of availabilities deleted
+        """
+        cutoff = self.get_cutoff(today)
+        archived, purged = self.archive_appointments(cutoff), self.purge_availabilities(cutoff)
+        if not self.stopped.is_set():
+            self.purge_capacity(cutoff)
+        return archived, purged
+
+    def start(self, interval):
+        """Run the job every interval seconds on a background thread until stop() is called."""
+        def run():
+            while not self.stopped.is_set():
+                try:
+                    archived, purged = self.run_once()
+                    if archived > 0 or purged > 0:
+                        print(f"Retention: archived {archived} appointment(s), purged {purged} availability(ies)")
+                except DatabaseError as db_err:
+                    print("Error occurred when archiving appointments: " + str(db_err))
+                self.stopped.wait(interval)
+
+        thread = threading.Thread(target=run, name="retention", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+
+def _per_day(days, change):
+    # the DailyCapacity changes for one row per entry of days, summed per day
+    changes = {}
+    for d in days:
+        available, booked = changes.get(Util.to_date(d), (0, 0))
+        changes[Util.to_date(d)] = (available + change[0], booked + change[1])
+    return changes
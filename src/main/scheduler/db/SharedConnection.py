@@ -0,0 +1,64 @@
+class SharedConnection:
+    """
+    One pooled connection, and one transaction, shared by every ConnectionManager inside ConnectionManager.shared().
+    Each command of the group runs under its own savepoint: commit() is deferred to the end of the group and rollback()
+    only undoes the current command, so a failing command does not take the rest of the group down with it.
+    """
+
+    def __init__(self, conn, backend):
+        self.conn = conn
+        self.backend = backend
+        self.savepoint = None
+        self.count = 0
+        self.rollback_callbacks = []
+
+    def cursor(self, *args, **kwargs):
+        return self.conn.cursor(*args, **kwargs)
+
+    def begin_command(self):
+        """Mark the start of the next command, which rollback() rewinds to."""
+        self.count += 1
+        self.savepoint = "command_" + str(self.count)
+        self.conn.cursor().execute(self.backend.savepoint_sql(self.savepoint))
+
+    def on_rollback(self, callback):
+        """
+        Call callback() once the work done so far by the current command is rolled back, e.g. to drop state
+        derived from it: by rollback() during this same command, or by rollback_group().
+        """
+        self.rollback_callbacks.append((self.savepoint, callback))
+
+    def _rolled_back(self, savepoint=None):
+        # rolling back to a savepoint only undoes the work registered under it, earlier commands are kept
+        kept = []
+        for registered, callback in self.rollback_callbacks:
+            if savepoint is None or registered == savepoint:
+                callback()
+            else:
+                kept.append((registered, callback))
+        self.rollback_callbacks = kept
+
+    def commit(self):
+        # the whole group commits at once in commit_group()
+        pass
+
+    def rollback(self):
+        if self.savepoint is None:
+            self.conn.rollback()
+        else:
+            self.conn.cursor().execute(self.backend.rollback_to_savepoint_sql(self.savepoint))
+        self._rolled_back(self.savepoint)
+
+    def commit_group(self):
+        self.savepoint = None
+        self.conn.commit()
+        self.rollback_callbacks = []
+
+    def rollback_group(self):
+        self.savepoint = None
+        self.conn.rollback()
+        self._rolled_back()
+
+    def close(self):
+        # the connection belongs to the group, which hands it back to the pool
+        pass
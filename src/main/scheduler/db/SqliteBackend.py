@@ -0,0 +1,149 @@
+import datetime
+import os
+import re
+import sqlite3
+from db.Backend import Backend
+
+# pymssql-style placeholders used by the models, rewritten to SQLite's qmark style
+PLACEHOLDER = re.compile(r"%[sd]")
+
+# DATE columns come back as datetime.date, like they do from SQL Server
+sqlite3.register_converter("date", lambda value: datetime.date.fromisoformat(value.decode()))
+
+
+def translate(sql):
+    return PLACEHOLDER.sub("?", sql)
+
+
+def adapt_params(params):
+    """Accept the pymssql calling conventions (a bare scalar or a tuple) and store dates as ISO strings."""
+    if params is None:
+        return ()
+    if not isinstance(params, (tuple, list)):
+        params = (params,)
+    adapted = []
+    for param in params:
+        if isinstance(param, datetime.datetime):
+            param = param.date().isoformat()
+        elif isinstance(param, datetime.date):
+            param = param.isoformat()
+        adapted.append(param)
+    return tuple(adapted)
+
+
+class SqliteCursor:
+    def __init__(self, cursor, as_dict=False):
+        self.cursor = cursor
+        self.as_dict = as_dict
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(translate(sql), adapt_params(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.cursor.executemany(translate(sql), (adapt_params(params) for params in seq_of_params))
+        return self
+
+    def _row(self, row):
+        if row is None or not self.as_dict:
+            return row
+        return {column[0]: value for column, value in zip(self.cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self.cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self.cursor.fetchmany(size) if size is not None else self.cursor.fetchmany()
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return [self._row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self.cursor:
+            yield self._row(row)
+
+    def close(self):
+        self.cursor.close()
+
+
+class SqliteConnection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self, as_dict=False):
+        return SqliteCursor(self.conn.cursor(), as_dict=as_dict)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class SqliteBackend(Backend):
+    """
+    Embedded SQLite engine for single-clinic deployments and local load testing.
+    DBPath names the database file; ":memory:" keeps a shared in-memory database alive for the life of the process.
+    """
+    name = "sqlite"
+    Error = sqlite3.Error
+    OperationalError = sqlite3.OperationalError
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else os.getenv("DBPath", "scheduler.db")
+        self.in_memory = self.path == ":memory:"
+        # every pooled connection must see the same in-memory database, which needs a shared-cache URI
+        self.target = "file:vaccine-scheduler?mode=memory&cache=shared" if self.in_memory else self.path
+        self.keeper = None
+
+    def _open(self):
+        conn = sqlite3.connect(self.target, uri=self.in_memory, timeout=30, check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES, isolation_level="IMMEDIATE")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def connect(self):
+        return SqliteConnection(self._open())
+
+    def initialize(self):
+        # the in-memory database disappears with its last connection, so hold one open while the pool churns
+        if self.in_memory and self.keeper is None:
+            self.keeper = self._open()
+        if not self.in_memory:
+            conn = self._open()
+            try:
+                conn.execute("PRAGMA journal_mode = WAL")
+            finally:
+                conn.close()
+
+    def close(self):
+        if self.keeper is not None:
+            self.keeper.close()
+            self.keeper = None
+
+    def execute_script(self, conn, script):
+        # executescript commits whatever is pending first, so open the migration's transaction explicitly
+        conn.conn.executescript("BEGIN;\n" + script)
+
+    def list_tables(self, conn):
+        return self._names(conn.cursor(), "SELECT name FROM sqlite_master WHERE type = 'table'")
+
+    def list_indexes(self, conn):
+        return self._names(conn.cursor(), "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
@@ -0,0 +1,383 @@
+import sys
+sys.path.append("../db/*")
+from db.ConnectionManager import ConnectionManager
+from db.IdAllocator import IdAllocator
+from model.Vaccine import Vaccine, TOTAL_DOSES
+from model.DailyCapacity import DailyCapacity, ADJUST_CAPACITY
+from model import AssignmentStrategy
+from util.Util import Util
+from enum import Enum
+import datetime
+
+
+# appointment IDs come from per-process blocks of the Appointments sequence
+appointment_ids = IdAllocator("Appointments", "Appointments", "Id")
+
+# how bookings choose among the available caregivers, set by AssignmentStrategy
+assignment = AssignmentStrategy.from_env()
+
+
+class ReservationStatus(Enum):
+    SUCCESS = "success"
+    NO_SUCH_VACCINE = "no_such_vaccine"
+    OUT_OF_STOCK = "out_of_stock"
+    NO_CAREGIVER = "no_caregiver"
+    ALREADY_BOOKED = "already_booked"
+
+
+class ReservationResult:
+    def __init__(self, status, appointment=None):
+        self.status = status
+        self.appointment = appointment
+
+    def is_success(self):
+        return self.status is ReservationStatus.SUCCESS
+
+
+class CancelStatus(Enum):
+    SUCCESS = "success"
+    NOT_FOUND = "not_found"
+    CONFLICT = "conflict"
+
+
+class CancelResult:
+    def __init__(self, status, canceled=None, missing=None):
+        self.status = status
+        self.canceled = canceled if canceled is not None else []
+        self.missing = missing if missing is not None else []
+
+
+class Appointment:
+    def __init__(self, appointment_id, caregiver, patient, vaccine_name, time):
+        self.appointment_id = appointment_id
+        self.caregiver = caregiver
+        self.patient = patient
+        self.vaccine_name = vaccine_name
+        self.time = time
+
+    # getters
+    def get_id(self):
+        return self.appointment_id
+
+    def get_caregiver(self):
+        return self.caregiver
+
+    def get_patient(self):
+        return self.patient
+
+    def get_vaccine_name(self):
+        return self.vaccine_name
+
+    def get_time(self):
+        return self.time
+
+    @staticmethod
+    def reserve(patient, vaccine_name, d):
+        """
+        Book an appointment for the patient in one transaction on one pooled connection.
+        The caregiver's slot and the vaccine dose are claimed with conditional writes, so two concurrent bookings
+        can never take the same slot or push the dose count below zero.
+        The caregiver is chosen in the database by the assignment strategy, one candidate at a time.
+        On SQL Server each candidate is tried in one batch; SQLite runs in-process, where statements cost no round trip.
+        --------
+        Parameters:
+        patient: str, username of the patient
+        vaccine_name: str
+        d: datetime in datetime(year, month, day) format
+        --------
+        Returns:
+        ReservationResult, carrying the new Appointment on success
+        Raises DatabaseError if the transaction fails, after rolling it back
+        """
+        backend = ConnectionManager.get_backend()
+        attempt = Appointment._attempt_batch if backend.supports_batches else Appointment._attempt
+        appointment_id = appointment_ids.next_id()
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                tried = []
+                while True:
+                    caregiver, claimed, booked, dosed = attempt(cursor, patient, vaccine_name, d, tried, appointment_id)
+                    if caregiver is None or booked:
+                        break
+                    if not claimed:
+                        # another booking claimed this caregiver first, try the next one
+                        tried.append(caregiver)
+                        continue
+                    if not dosed:
+                        conn.rollback()
+                        return ReservationResult(Appointment._failure_status(cursor, patient, vaccine_name, d))
+
+                    conn.commit()
+                    assignment.assigned(caregiver)
+                    return ReservationResult(ReservationStatus.SUCCESS,
+                                             Appointment(appointment_id, caregiver, patient, vaccine_name, d))
+
+                conn.rollback()
+                return ReservationResult(Appointment._failure_status(cursor, patient, vaccine_name, d))
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _attempt(cursor, patient, vaccine_name, d, tried, appointment_id):
+        """
+        Try to book one candidate caregiver inside the cursor's transaction, one statement at a time.
+        --------
+        Returns:
+        caregiver: the candidate chosen by the assignment strategy, None if nobody else is available
+        claimed: whether the caregiver's slot was claimed
+        booked: whether the claim failed because the patient already has an appointment that day
+        dosed: whether a dose was taken and the appointment inserted
+        """
+        # the slot is only claimed if the patient has no appointment that day, an index seek on (Pusername, Time)
+        claim_slot = "DELETE FROM Availabilities WHERE (Time = %s AND Username = %s AND NOT EXISTS " \
+                     "(SELECT Id FROM Appointments WHERE Pusername = %s AND Time = %s))"
+        check_patient = "SELECT Time FROM Appointments WHERE (Pusername = %s AND Time = %s)"
+        add_appointment = "INSERT INTO Appointments VALUES (%d, %s, %s, %s, %s)"
+
+        caregiver = assignment.pick(cursor, d, patient, tried)
+        if caregiver is None:
+            return None, False, False, False
+        cursor.execute(claim_slot, (d, caregiver, patient, d))
+        if cursor.rowcount != 1:
+            cursor.execute(check_patient, (patient, d))
+            return caregiver, False, cursor.fetchone() is not None, False
+        if not Vaccine.take_dose(cursor, vaccine_name):
+            return caregiver, True, False, False
+        cursor.execute(add_appointment, (appointment_id, caregiver, patient, vaccine_name, d))
+        DailyCapacity.adjust(cursor, {d: (-1, 1)})
+        return caregiver, True, False, True
+
+    @staticmethod
+    def _attempt_batch(cursor, patient, vaccine_name, d, tried, appointment_id):
+        """
+        Try to book one candidate caregiver like _attempt(), sending the choice of the caregiver, the claim,
+        the dose, the appointment and the capacity update to the server as a single batch, so an uncontended
+        booking is one round trip plus the commit. Each step checks @@ROWCOUNT of the one before it.
+        """
+        candidates, params = assignment.candidates_sql(d, patient, tried)
+        # the same steps as take_dose(); a shard locked by another booking is skipped rather than waited for
+        book = "SET NOCOUNT ON; " \
+               "DECLARE @caregiver varchar(255), @claimed int = 0, @booked int = 0, @dosed int = 0; " \
+               "SELECT TOP 1 @caregiver = Username " + candidates + "; " \
+               "IF @caregiver IS NOT NULL BEGIN " \
+               "DELETE FROM Availabilities WHERE (Time = %s AND Username = @caregiver AND NOT EXISTS " \
+               "(SELECT Id FROM Appointments WHERE Pusername = %s AND Time = %s)); " \
+               "SET @claimed = @@ROWCOUNT; " \
+               "IF @claimed = 0 BEGIN " \
+               "IF EXISTS (SELECT Id FROM Appointments WHERE Pusername = %s AND Time = %s) SET @booked = 1; " \
+               "END ELSE BEGIN " \
+               "UPDATE Vaccines SET Doses = Doses - 1 WHERE (Name = %s AND Doses > 0); " \
+               "SET @dosed = @@ROWCOUNT; " \
+               "IF @dosed = 0 BEGIN " \
+               "UPDATE TOP (1) VaccineShards WITH (READPAST) SET Doses = Doses - 1 WHERE (Name = %s AND Doses > 0); " \
+               "SET @dosed = @@ROWCOUNT; " \
+               "END; " \
+               "IF @dosed = 1 BEGIN " \
+               "INSERT INTO Appointments VALUES (%d, @caregiver, %s, %s, %s); " + ADJUST_CAPACITY + "; " \
+               "END; " \
+               "END; " \
+               "END; " \
+               "SELECT @caregiver AS Caregiver, @claimed AS Claimed, @booked AS Booked, @dosed AS Dosed"
+        params += (d, patient, d, patient, d, vaccine_name, vaccine_name, appointment_id, patient, vaccine_name, d,
+                   -1, 1, d)
+        cursor.execute(book, params)
+        row = cursor.fetchone()
+        return row["Caregiver"], row["Claimed"] == 1, row["Booked"] == 1, row["Dosed"] == 1
+
+    @staticmethod
+    def find_next_slot(from_date, patient=None):
+        """
+        Find the earliest day on or after from_date with an available caregiver.
+        The search walks the (Time, Username) primary key of Availabilities in date order and stops at the first
+        match, so it costs one index seek however far away the slot is.
+        --------
+        Parameters:
+        from_date: datetime in datetime(year, month, day) format
+        patient: str, optional username of a patient whose booked days are skipped
+        --------
+        Returns:
+        the date of the slot, or None if no caregiver is available from from_date on
+        """
+        find_slot = "SELECT Time FROM Availabilities WHERE Time >= %s ORDER BY Time"
+        params = (from_date,)
+        if patient is not None:
+            find_slot = "SELECT Time FROM Availabilities WHERE Time >= %s AND NOT EXISTS " \
+                        "(SELECT Id FROM Appointments WHERE Pusername = %s AND Time = Availabilities.Time) ORDER BY Time"
+            params = (from_date, patient)
+
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute(ConnectionManager.get_backend().limit_sql(find_slot, 1), params)
+            row = cursor.fetchone()
+            return row["Time"] if row is not None else None
+
+    @staticmethod
+    def reserve_next(patient, vaccine_name, from_date, attempts=5):
+        """
+        Book the earliest slot on or after from_date for the patient.
+        Each attempt books one day with reserve(); if another booking took the last caregiver of that day in the
+        meantime, the search resumes from that day.
+        --------
+        Returns:
+        ReservationResult, carrying the new Appointment on success
+        """
+        result = ReservationResult(ReservationStatus.NO_CAREGIVER)
+        for attempt in range(attempts):
+            slot = Appointment.find_next_slot(from_date, patient)
+            if slot is None:
+                return ReservationResult(ReservationStatus.NO_CAREGIVER)
+            d = datetime.datetime(slot.year, slot.month, slot.day)
+            result = Appointment.reserve(patient, vaccine_name, d)
+            if result.status is not ReservationStatus.NO_CAREGIVER:
+                return result
+            from_date = d
+        return result
+
+    @staticmethod
+    def iter_appointments(username, is_caregiver, start=None, end=None, page_size=100, archived=False):
+        """
+        Stream a user's appointments in date order, one page at a time, in constant memory.
+        Pages are read with keyset pagination on (Time, Id), so every page is an index seek on the user's
+        (Pusername, Time) or (Cusername, Time, Id) index however deep into the history it is, and the pooled
+        connection is only borrowed while a page is read.
+        --------
+        Parameters:
+        username: str, the patient or caregiver
+        is_caregiver: bool, whether username is a caregiver's
+        start, end: optional datetimes in datetime(year, month, day) format bounding the dates, both included
+        page_size: the number of rows read per query
+        archived: read the past appointments moved to AppointmentsArchive by db/Retention.py instead
+        --------
+        Returns:
+        a generator of Appointment
+        """
+        user_column = "Cusername" if is_caregiver else "Pusername"
+        columns = "SELECT Id, Cusername, Pusername, Vname, Time FROM " + \
+                  ("AppointmentsArchive" if archived else "Appointments")
+        backend = ConnectionManager.get_backend()
+        last = None
+        while True:
+            conditions = [user_column + " = %s"]
+            params = [username]
+            if last is not None:
+                conditions.append("(Time > %s OR (Time = %s AND Id > %d))")
+                params += [last.time, last.time, last.appointment_id]
+            elif start is not None:
+                conditions.append("Time >= %s")
+                params.append(start)
+            if end is not None:
+                conditions.append("Time <= %s")
+                params.append(end)
+            get_page = backend.limit_sql(columns + " WHERE " + " AND ".join(conditions) + " ORDER BY Time, Id",
+                                         page_size)
+
+            with ConnectionManager() as conn:
+                cursor = conn.cursor(as_dict=True)
+                cursor.execute(get_page, tuple(params))
+                page = [Appointment(row["Id"], row["Cusername"], row["Pusername"], row["Vname"], row["Time"])
+                        for row in cursor.fetchall()]
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    @staticmethod
+    def cancel(username, is_caregiver, ids=None, d=None):
+        """
+        Cancel a user's appointments, given by ID or as every appointment on one day, in one transaction:
+        the appointments are deleted, their doses returned and their caregivers' slots offered again together,
+        or not at all.
+        A caregiver cancelling a whole day is taken to be unavailable that day, so their slots are not offered
+        again and any availability left on that day is withdrawn as well.
+        --------
+        Parameters:
+        username: str, the patient or caregiver cancelling
+        is_caregiver: bool, whether username is a caregiver's
+        ids: a list of appointment IDs, cancelled all together or not at all
+        d: or a datetime in datetime(year, month, day) format, to cancel every appointment on that day
+        --------
+        Returns:
+        CancelResult, carrying the cancelled Appointments on success, the IDs that are not the user's appointments
+        if the status is NOT_FOUND, or CONFLICT if a concurrent cancellation got to some of them first;
+        in both failures nothing was cancelled
+        Raises DatabaseError if the transaction fails, after rolling it back
+        """
+        user_column = "Cusername" if is_caregiver else "Pusername"
+        if ids is not None:
+            ids = list(dict.fromkeys(ids))
+            condition = f"{user_column} = %s AND Id IN ({', '.join(['%d'] * len(ids))})"
+            params = (username,) + tuple(ids)
+        else:
+            condition = f"{user_column} = %s AND Time = %s"
+            params = (username, d)
+        get_appointments = "SELECT Id, Cusername, Pusername, Vname, Time FROM Appointments WHERE " + condition
+        delete_appointments = "DELETE FROM Appointments WHERE " + condition
+        add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
+        withdraw_availability = "DELETE FROM Availabilities WHERE (Time = %s AND Username = %s)"
+        restore_slots = ids is not None or not is_caregiver
+
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(get_appointments, params)
+                canceled = [Appointment(row["Id"], row["Cusername"], row["Pusername"], row["Vname"], row["Time"])
+                            for row in cursor.fetchall()]
+                if ids is not None:
+                    missing = sorted(set(ids) - {appointment.get_id() for appointment in canceled})
+                    if len(missing) > 0:
+                        conn.rollback()
+                        return CancelResult(CancelStatus.NOT_FOUND, missing=missing)
+
+                cursor.execute(delete_appointments, params)
+                if cursor.rowcount != len(canceled):
+                    # a concurrent cancellation got to some of them first and has already returned their doses
+                    conn.rollback()
+                    return CancelResult(CancelStatus.CONFLICT)
+                # keyed by date, so the day of the appointments and the day given to cancel share one row update
+                changes = {}
+                for appointment in canceled:
+                    day = Util.to_date(appointment.get_time())
+                    available, booked = changes.get(day, (0, 0))
+                    changes[day] = (available + (1 if restore_slots else 0), booked - 1)
+                if restore_slots:
+                    if len(canceled) > 0:
+                        cursor.executemany(add_availability, [(appointment.get_time(), appointment.get_caregiver())
+                                                              for appointment in canceled])
+                else:
+                    cursor.execute(withdraw_availability, (d, username))
+                    if cursor.rowcount > 0:
+                        available, booked = changes.get(Util.to_date(d), (0, 0))
+                        changes[Util.to_date(d)] = (available - cursor.rowcount, booked)
+                DailyCapacity.adjust(cursor, changes)
+                doses = {}
+                for appointment in canceled:
+                    doses[appointment.get_vaccine_name()] = doses.get(appointment.get_vaccine_name(), 0) + 1
+                Vaccine.return_doses(cursor, doses)
+                conn.commit()
+                return CancelResult(CancelStatus.SUCCESS, canceled=canceled)
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _failure_status(cursor, patient, vaccine_name, d):
+        # only reached once a booking failed, to tell the user why, checking in the order the prompt always has
+        cursor.execute(TOTAL_DOSES + " WHERE Name = %s", vaccine_name)
+        row = cursor.fetchone()
+        if row is None:
+            return ReservationStatus.NO_SUCH_VACCINE
+        if row["Doses"] <= 0:
+            return ReservationStatus.OUT_OF_STOCK
+        cursor.execute("SELECT Username FROM Availabilities WHERE Time = %s", d)
+        if cursor.fetchone() is None:
+            return ReservationStatus.NO_CAREGIVER
+        cursor.execute("SELECT Time FROM Appointments WHERE (Pusername = %s AND Time = %s)", (patient, d))
+        if cursor.fetchone() is not None:
+            return ReservationStatus.ALREADY_BOOKED
+        return ReservationStatus.NO_CAREGIVER
+
+    def __str__(self):
+        return f"(Appointment ID: {self.appointment_id}, Caregiver: {self.caregiver}, Patient: {self.patient}, " \
+               f"Vaccine: {self.vaccine_name}, Date: {self.time})"
@@ -0,0 +1,126 @@
+import datetime
+import os
+import sys
+import threading
+sys.path.append("../db/*")
+from db.ConnectionManager import ConnectionManager
+
+
+class AssignmentStrategy:
+    """
+    Chooses which available caregiver a booking goes to. The database picks the one candidate with an ORDER BY
+    and a row limit, so a booking reads a single username however many caregivers are available that day.
+    Subclasses give the order; the caregivers already tried by the booking are left out.
+    """
+    name = None
+
+    def pick(self, cursor, d, patient, tried=()):
+        """
+        Choose a caregiver available on the given date inside the cursor's transaction.
+        --------
+        Parameters:
+        d: datetime in datetime(year, month, day) format
+        patient: str, username of the patient booking
+        tried: usernames of the caregivers this booking could not claim, which are skipped
+        --------
+        Returns:
+        the caregiver's username, or None if nobody else is available that day
+        """
+        candidates, params = self.candidates_sql(d, patient, tried)
+        cursor.execute(ConnectionManager.get_backend().limit_sql("SELECT Username " + candidates, 1), params)
+        row = cursor.fetchone()
+        return row["Username"] if row is not None else None
+
+    def candidates_sql(self, d, patient, tried=()):
+        """
+        Return the FROM, WHERE and ORDER BY clauses selecting the candidates, best first, and their parameters,
+        for pick() or for a batch that chooses the caregiver and books it in one round trip.
+        """
+        order_by, order_params = self.order_by(d, patient)
+        candidates = "FROM Availabilities WHERE Time = %s"
+        params = (d,)
+        if len(tried) > 0:
+            candidates += " AND Username NOT IN (" + ", ".join(["%s"] * len(tried)) + ")"
+            params += tuple(tried)
+        return candidates + " ORDER BY " + order_by, params + tuple(order_params)
+
+    def order_by(self, d, patient):
+        """Return the ORDER BY expression ranking the candidates, best first, and its parameters."""
+        raise NotImplementedError
+
+    def assigned(self, caregiver):
+        """Called after the booking with the chosen caregiver committed."""
+        pass
+
+
+class RandomStrategy(AssignmentStrategy):
+    """Any available caregiver, with equal chances."""
+    name = "random"
+
+    def order_by(self, d, patient):
+        return ConnectionManager.get_backend().random_sql(), ()
+
+
+class RoundRobinStrategy(AssignmentStrategy):
+    """
+    The available caregiver whose username comes next after the last one this process assigned, wrapping around
+    to the first username, found in the day's range of the (Time, Username) primary key of Availabilities.
+    """
+    name = "round_robin"
+
+    def __init__(self):
+        self.last = None
+        self.lock = threading.Lock()
+
+    def order_by(self, d, patient):
+        with self.lock:
+            last = self.last
+        if last is None:
+            return "Username", ()
+        return "CASE WHEN Username > %s THEN 0 ELSE 1 END, Username", (last,)
+
+    def assigned(self, caregiver):
+        with self.lock:
+            self.last = caregiver
+
+
+class LeastBookedStrategy(AssignmentStrategy):
+    """
+    The available caregiver with the fewest appointments in the week (Monday to Sunday) of the booking,
+    counted with a seek on the (Cusername, Time) index of Appointments per candidate.
+    """
+    name = "least_booked"
+
+    def order_by(self, d, patient):
+        week_start = d - datetime.timedelta(days=d.weekday())
+        return "(SELECT COUNT(*) FROM Appointments WHERE Cusername = Availabilities.Username " \
+               "AND Time >= %s AND Time < %s), Username", (week_start, week_start + datetime.timedelta(days=7))
+
+
+class PreferredStrategy(LeastBookedStrategy):
+    """
+    An available caregiver the patient has had an appointment with before, for continuity of care,
+    otherwise the least booked one that week.
+    """
+    name = "preferred"
+
+    def order_by(self, d, patient):
+        least_booked, params = super().order_by(d, patient)
+        return "CASE WHEN EXISTS (SELECT Id FROM Appointments WHERE Pusername = %s " \
+               "AND Cusername = Availabilities.Username) THEN 0 ELSE 1 END, " + least_booked, (patient,) + params
+
+
+STRATEGIES = {strategy.name: strategy for strategy in
+              (RandomStrategy, RoundRobinStrategy, LeastBookedStrategy, PreferredStrategy)}
+
+
+def get_strategy(name):
+    """Return a new strategy of the given name, one of STRATEGIES, or raise ValueError."""
+    if name not in STRATEGIES:
+        raise ValueError("Unknown assignment strategy " + name + ", expected one of " + ", ".join(sorted(STRATEGIES)))
+    return STRATEGIES[name]()
+
+
+def from_env():
+    """Return the strategy named by AssignmentStrategy, random by default."""
+    return get_strategy(os.getenv("AssignmentStrategy", "random"))
@@ -1,9 +1,11 @@
 import sys
 sys.path.append("../util/*")
 sys.path.append("../db/*")
+from util.HashPool import HashPool
 from util.Util import Util
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.ConnectionManager import DatabaseError
+from model.DailyCapacity import DailyCapacity
 
 
 class Caregiver:
@@ -15,30 +17,28 @@ class Caregiver:
 
     # getters
     def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
         get_caregiver_details = "SELECT Salt, Hash FROM Caregivers WHERE Username = %s"
-        try:
-            cursor.execute(get_caregiver_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    return self
-        except pymssql.Error:
-            print("Error occurred when getting Caregivers")
-            cm.close_connection()
+        row = None
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(get_caregiver_details, self.username)
+                row = cursor.fetchone()
+            except DatabaseError:
+                print("Error occurred when getting Caregivers")
+        if row is None:
+            return None
 
-        cm.close_connection()
-        return None
+        # the connection is back in the pool before the slow key derivation starts
+        curr_salt = row['Salt']
+        curr_hash = row['Hash']
+        calculated_hash = HashPool.generate_hash(self.password, curr_salt)
+        if not curr_hash == calculated_hash:
+            return None
+        else:
+            self.salt = curr_salt
+            self.hash = calculated_hash
+            return self
 
     def get_username(self):
         return self.username
@@ -50,34 +50,73 @@ class Caregiver:
         return self.hash
 
     def save_to_db(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
         add_caregivers = "INSERT INTO Caregivers VALUES (%s, %s, %s)"
-        try:
-            cursor.execute(add_caregivers, (self.username, self.salt, self.hash))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error as db_err:
-            print("Error occurred when inserting Caregivers")
-            sqlrc = str(db_err.args[0])
-            print("Exception code: " + str(sqlrc))
-            cm.close_connection()
-        cm.close_connection()
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(add_caregivers, (self.username, self.salt, self.hash))
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+            except DatabaseError as db_err:
+                print("Error occurred when inserting Caregivers")
+                sqlrc = str(db_err.args[0])
+                print("Exception code: " + str(sqlrc))
 
     # Insert availability with parameter date d
     def upload_availability(self, d):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
+        add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(add_availability, (d, self.username))
+                DailyCapacity.add_available(cursor, [d])
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+            except DatabaseError:
+                # let the caller report the failure instead of the upload looking successful
+                conn.rollback()
+                print("Error occurred when updating caregiver availability")
+                raise
 
+    # Insert availability on many dates at once, skipping the days already booked or already available
+    def upload_availabilities(self, dates):
+        """
+        Publish availability on every date in dates within one transaction.
+        The conflicts are found with one query per table over the whole range instead of one query per date,
+        and the remaining rows go in with a single executemany.
+        --------
+        Returns:
+        uploaded: the dates that were inserted
+        booked: the dates skipped because the caregiver already has an appointment then
+        existing: the dates skipped because the availability was already uploaded
+        """
+        if len(dates) == 0:
+            return [], [], []
+        first, last = min(dates), max(dates)
+        get_booked = "SELECT Time FROM Appointments WHERE Cusername = %s AND Time >= %s AND Time <= %s"
+        get_existing = "SELECT Time FROM Availabilities WHERE Username = %s AND Time >= %s AND Time <= %s"
         add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
-        try:
-            cursor.execute(add_availability, (d, self.username))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            print("Error occurred when updating caregiver availability")
-            cm.close_connection()
-        cm.close_connection()
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(get_booked, (self.username, first, last))
+                booked_days = {Util.to_date(row["Time"]) for row in cursor.fetchall()}
+                cursor.execute(get_existing, (self.username, first, last))
+                existing_days = {Util.to_date(row["Time"]) for row in cursor.fetchall()}
+
+                uploaded, booked, existing = [], [], []
+                for d in dates:
+                    if Util.to_date(d) in booked_days:
+                        booked.append(d)
+                    elif Util.to_date(d) in existing_days:
+                        existing.append(d)
+                    else:
+                        uploaded.append(d)
+                if len(uploaded) > 0:
+                    cursor.executemany(add_availability, [(d, self.username) for d in uploaded])
+                    DailyCapacity.add_available(cursor, uploaded)
+                conn.commit()
+                return uploaded, booked, existing
+            except DatabaseError:
+                conn.rollback()
+                raise
@@ -0,0 +1,156 @@
+import sys
+sys.path.append("../db/*")
+from db.ConnectionManager import ConnectionManager
+from db.ConnectionManager import DatabaseError
+from util.Util import Util
+
+# the capacity of every day as counted from the Availabilities and Appointments rows themselves
+COUNT_CAPACITY = "SELECT Time, SUM(Available) AS Available, SUM(Booked) AS Booked FROM (" \
+                 "SELECT Time, 1 AS Available, 0 AS Booked FROM Availabilities{where} UNION ALL " \
+                 "SELECT Time, 0 AS Available, 1 AS Booked FROM Appointments{where}) AS Slots GROUP BY Time"
+
+# add open slots and booked appointments to the row of one day
+ADJUST_CAPACITY = "UPDATE DailyCapacity SET Available = Available + %d, Booked = Booked + %d WHERE Time = %s"
+
+
+class DailyCapacity:
+    """
+    The DailyCapacity summary table: one row per day with the number of open caregiver slots and of booked
+    appointments. The commands that write Availabilities and Appointments adjust it in the same transaction,
+    so reading a day's capacity is a primary key seek instead of a count over the day's rows.
+    """
+
+    def __init__(self, time, available, booked):
+        self.time = time
+        self.available = available
+        self.booked = booked
+
+    # getters
+    def get_time(self):
+        return self.time
+
+    def get_available(self):
+        return self.available
+
+    def get_booked(self):
+        return self.booked
+
+    @staticmethod
+    def add_available(cursor, days):
+        """
+        Count one more open slot on every day in days inside the cursor's transaction, creating the rows of days
+        seen for the first time. Used by upload_availability, the only writer that can bring a new day in.
+        The missing rows are inserted under a NOT EXISTS guard that holds its key-range lock on SQL Server,
+        so two first uploads of the same new day queue up instead of failing on the primary key.
+        --------
+        Parameters:
+        days: a list of datetimes in datetime(year, month, day) format, a day listed twice counts twice
+        """
+        if len(days) == 0:
+            return
+        counts = {}
+        for d in days:
+            counts[d] = counts.get(d, 0) + 1
+        add_missing = "INSERT INTO DailyCapacity (Time, Available, Booked) SELECT %s, 0, 0 WHERE NOT EXISTS " \
+                      "(SELECT Time FROM DailyCapacity" + ConnectionManager.get_backend().lock_hint_sql() + \
+                      " WHERE Time = %s)"
+        cursor.executemany(add_missing, [(d, d) for d in counts])
+        cursor.executemany("UPDATE DailyCapacity SET Available = Available + %d WHERE Time = %s",
+                           [(num, d) for d, num in counts.items()])
+
+    @staticmethod
+    def adjust(cursor, changes):
+        """
+        Change the rows of days that already have one inside the cursor's transaction.
+        A day before the retention cutoff has no row and is left alone.
+        --------
+        Parameters:
+        changes: a dictionary of datetime to the (open slots, booked appointments) to add, e.g. (-1, 1) for a booking
+        """
+        if len(changes) > 0:
+            cursor.executemany(ADJUST_CAPACITY, [(available, booked, d) for d, (available, booked) in changes.items()])
+
+    @staticmethod
+    def get_range(start, end):
+        """
+        Stream the capacity of every day between two dates with a row, in date order.
+        --------
+        Parameters:
+        start, end: datetime in datetime(year, month, day) format, both included
+        --------
+        Returns:
+        a generator of DailyCapacity
+        """
+        get_capacity = "SELECT Time, Available, Booked FROM DailyCapacity WHERE Time >= %s AND Time <= %s ORDER BY Time"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            cursor.execute(get_capacity, (start, end))
+            for row in cursor:
+                yield DailyCapacity(row["Time"], row["Available"], row["Booked"])
+
+    @staticmethod
+    def check(start=None, end=None):
+        """
+        Compare the summary with a recount of Availabilities and Appointments, without changing anything.
+        --------
+        Parameters:
+        start, end: optional datetimes bounding the days compared, both included; every day by default
+        --------
+        Returns:
+        the number of days whose row is missing, stale or left over
+        """
+        where, params = _range(start, end)
+        with ConnectionManager() as conn:
+            return _drift(conn.cursor(as_dict=True), where, params)
+
+    @staticmethod
+    def rebuild(start=None, end=None):
+        """
+        Recount the summary from Availabilities and Appointments in one transaction, repairing any drift,
+        e.g. left behind by rows written outside the scheduler.
+        --------
+        Parameters:
+        start, end: optional datetimes bounding the days recounted, both included; every day by default
+        --------
+        Returns:
+        the number of days whose row was missing, stale or left over
+        Raises DatabaseError if the transaction fails, after rolling it back
+        """
+        where, params = _range(start, end)
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                repaired = _drift(cursor, where, params)
+                cursor.execute("DELETE FROM DailyCapacity" + where, params)
+                cursor.execute("INSERT INTO DailyCapacity (Time, Available, Booked) " + COUNT_CAPACITY.format(where=where),
+                               params * 2)
+                conn.commit()
+                return repaired
+            except DatabaseError:
+                conn.rollback()
+                raise
+
+    def __str__(self):
+        return f"(Date: {self.time}, Available: {self.available}, Booked: {self.booked})"
+
+
+def _range(start, end):
+    # the WHERE clause and parameters of a date range, empty if it is unbounded
+    conditions = []
+    params = ()
+    if start is not None:
+        conditions.append("Time >= %s")
+        params += (start,)
+    if end is not None:
+        conditions.append("Time <= %s")
+        params += (end,)
+    return (" WHERE " + " AND ".join(conditions) if len(conditions) > 0 else ""), params
+
+
+def _drift(cursor, where, params):
+    cursor.execute(COUNT_CAPACITY.format(where=where), params * 2)
+    actual = {Util.to_date(row["Time"]): (row["Available"], row["Booked"]) for row in cursor.fetchall()}
+    cursor.execute("SELECT Time, Available, Booked FROM DailyCapacity" + where, params)
+    stored = {Util.to_date(row["Time"]): (row["Available"], row["Booked"]) for row in cursor.fetchall()}
+    # a row of zeros is left behind once a day's last slot is withdrawn, and is no drift
+    return sum(1 for d in actual.keys() | stored.keys() if actual.get(d, (0, 0)) != stored.get(d, (0, 0)))
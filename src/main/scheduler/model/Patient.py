@@ -1,9 +1,9 @@
 import sys
 sys.path.append("../util/*")
 sys.path.append("../db/*")
-from util.Util import Util
+from util.HashPool import HashPool
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.ConnectionManager import DatabaseError
 
 
 class Patient:
@@ -14,30 +14,28 @@ class Patient:
         self.hash = hash
     
     def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
         get_patient_details = "SELECT Salt, Hash FROM Patients WHERE Username = %s"
-        try:
-            cursor.execute(get_patient_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    return self
-        except pymssql.Error:
-            print("Error occurred when getting Patients")
-            cm.close_connection()
-
-        cm.close_connection()
-        return None
+        row = None
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(get_patient_details, self.username)
+                row = cursor.fetchone()
+            except DatabaseError:
+                print("Error occurred when getting Patients")
+        if row is None:
+            return None
+
+        # the connection is back in the pool before the slow key derivation starts
+        curr_salt = row['Salt']
+        curr_hash = row['Hash']
+        calculated_hash = HashPool.generate_hash(self.password, curr_salt)
+        if not curr_hash == calculated_hash:
+            return None
+        else:
+            self.salt = curr_salt
+            self.hash = calculated_hash
+            return self
 
     def get_username(self):
         return self.username
@@ -49,18 +47,14 @@ class Patient:
         return self.hash
 
     def save_to_db(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
         add_patients = "INSERT INTO Patients VALUES (%s, %s, %s)"
-        try:
-            cursor.execute(add_patients, (self.username, self.salt, self.hash))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error as db_err:
-            print("Error occurred when inserting Patients")
-            sqlrc = str(db_err.args[0])
-            print("Exception code: " + str(sqlrc))
-            cm.close_connection()
-        cm.close_connection()
\ No newline at end of file
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(add_patients, (self.username, self.salt, self.hash))
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+            except DatabaseError as db_err:
+                print("Error occurred when inserting Patients")
+                sqlrc = str(db_err.args[0])
+                print("Exception code: " + str(sqlrc))
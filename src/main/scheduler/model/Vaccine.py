@@ -1,7 +1,12 @@
 import sys
 sys.path.append("../db/*")
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db.ConnectionManager import DatabaseError
+import random
+
+# every vaccine's name and available doses, counting the doses of a sharded vaccine's shards
+TOTAL_DOSES = "SELECT Name, Doses + COALESCE((SELECT SUM(Doses) FROM VaccineShards " \
+              "WHERE VaccineShards.Name = Vaccines.Name), 0) AS Doses FROM Vaccines"
 
 
 class Vaccine:
@@ -11,20 +16,16 @@ class Vaccine:
 
     # getters
     def get(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
-        get_vaccine = "SELECT Name, Doses FROM Vaccines WHERE Name = %s"
-        try:
-            cursor.execute(get_vaccine, self.vaccine_name)
-            for row in cursor:
-                self.available_doses = row['Doses']
-                return self
-        except pymssql.Error:
-            print("Error occurred when getting Vaccine")
-            cm.close_connection()
-        cm.close_connection()
+        get_vaccine = TOTAL_DOSES + " WHERE Name = %s"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(get_vaccine, self.vaccine_name)
+                for row in cursor:
+                    self.available_doses = row['Doses']
+                    return self
+            except DatabaseError:
+                print("Error occurred when getting Vaccine")
         return None
 
     def get_vaccine_name(self):
@@ -34,59 +35,142 @@ class Vaccine:
         return self.available_doses
 
     def save_to_db(self):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
         add_doses = "INSERT INTO VACCINES VALUES (%s, %d)"
-        try:
-            cursor.execute(add_doses, (self.vaccine_name, self.available_doses))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            print("Error occurred when insert Vaccines")
-            cm.close_connection()
-        cm.close_connection()
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(add_doses, (self.vaccine_name, self.available_doses))
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+            except DatabaseError:
+                print("Error occurred when insert Vaccines")
 
     # Increment the available doses
     def increase_available_doses(self, num):
         if num <= 0:
-            ValueError("Argument cannot be negative!")
-        self.available_doses += num
-
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
-        try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            print("Error occurred when updating vaccine availability")
-            cm.close_connection()
-        cm.close_connection()
+            raise ValueError("Argument cannot be negative!")
+
+        # relative updates, so concurrent bookings and cancellations never overwrite each other's counts
+        add_doses = "UPDATE Vaccines SET Doses = Doses + %d WHERE Name = %s"
+        get_shards = "SELECT Shard FROM VaccineShards WHERE Name = %s ORDER BY Shard"
+        add_shard_doses = "UPDATE VaccineShards SET Doses = Doses + %d WHERE Name = %s AND Shard = %d"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(get_shards, self.vaccine_name)
+                shards = [row["Shard"] for row in cursor.fetchall()]
+                if len(shards) == 0:
+                    cursor.execute(add_doses, (num, self.vaccine_name))
+                    if cursor.rowcount != 1:
+                        conn.rollback()
+                        raise ValueError("No such vaccine!")
+                else:
+                    # a sharded vaccine spreads new doses evenly over its shards
+                    for i, shard in enumerate(shards):
+                        share = num // len(shards) + (1 if i < num % len(shards) else 0)
+                        if share > 0:
+                            cursor.execute(add_shard_doses, (share, self.vaccine_name, shard))
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+                self.available_doses += num
+            except DatabaseError:
+                conn.rollback()
+                print("Error occurred when updating vaccine availability")
 
     # Decrement the available doses
     def decrease_available_doses(self, num):
-        if self.available_doses - num < 0:
-            ValueError("Not enough available doses!")
-        self.available_doses -= num
-
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
-        try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
-            # you must call commit() to persist your data if you don't set autocommit to True
-            conn.commit()
-        except pymssql.Error:
-            print("Error occurred when updating vaccine availability")
-            cm.close_connection()
-        cm.close_connection()
+        if num <= 0:
+            raise ValueError("Argument cannot be negative!")
+
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                for i in range(num):
+                    if not Vaccine.take_dose(cursor, self.vaccine_name):
+                        conn.rollback()
+                        raise ValueError("Not enough available doses!")
+                # you must call commit() to persist your data if you don't set autocommit to True
+                conn.commit()
+                self.available_doses -= num
+            except DatabaseError:
+                conn.rollback()
+                print("Error occurred when updating vaccine availability")
+
+    @staticmethod
+    def take_dose(cursor, vaccine_name):
+        """
+        Take one dose of the vaccine inside the cursor's transaction, without ever going below zero.
+        Doses are taken from the Vaccines row first and from a random shard with doses left once it is empty,
+        so bookings of a sharded vaccine lock one of several rows instead of all queuing on the same one.
+        --------
+        Returns:
+        True if a dose was taken, False if the vaccine has none left or does not exist
+        """
+        take_dose = "UPDATE Vaccines SET Doses = Doses - 1 WHERE (Name = %s AND Doses > 0)"
+        get_shards = "SELECT Shard FROM VaccineShards WHERE (Name = %s AND Doses > 0)"
+        take_shard_dose = "UPDATE VaccineShards SET Doses = Doses - 1 WHERE (Name = %s AND Shard = %d AND Doses > 0)"
+
+        cursor.execute(take_dose, vaccine_name)
+        if cursor.rowcount == 1:
+            return True
+        cursor.execute(get_shards, vaccine_name)
+        shards = [row["Shard"] for row in cursor.fetchall()]
+        random.shuffle(shards)
+        for shard in shards:
+            # another booking may empty the shard between the read and the update, then try the next one
+            cursor.execute(take_shard_dose, (vaccine_name, shard))
+            if cursor.rowcount == 1:
+                return True
+        return False
+
+    @staticmethod
+    def return_doses(cursor, doses):
+        """
+        Put doses back inside the cursor's transaction, e.g. those of cancelled appointments.
+        They go to the Vaccines row, which take_dose() empties first, sharded or not.
+        --------
+        Parameters:
+        doses: a dictionary of vaccine name to the number of doses to return
+        """
+        if len(doses) > 0:
+            cursor.executemany("UPDATE Vaccines SET Doses = Doses + %d WHERE Name = %s",
+                               [(num, vaccine_name) for vaccine_name, num in doses.items()])
+
+    def shard(self, shards):
+        """
+        Spread the vaccine's doses evenly over the given number of shard rows, or fold them back into the
+        Vaccines row if shards is 1. Shard a vaccine once it is booked faster than one row lock can serve.
+        """
+        if shards <= 0:
+            raise ValueError("Argument cannot be negative!")
+
+        # locking the shards first keeps concurrent bookings from taking a dose that is being moved
+        lock_shards = "UPDATE VaccineShards SET Doses = Doses WHERE Name = %s"
+        fold_shards = "UPDATE Vaccines SET Doses = Doses + " \
+                      "COALESCE((SELECT SUM(Doses) FROM VaccineShards WHERE Name = %s), 0) WHERE Name = %s"
+        drop_shards = "DELETE FROM VaccineShards WHERE Name = %s"
+        get_doses = "SELECT Doses FROM Vaccines WHERE Name = %s"
+        empty_vaccine = "UPDATE Vaccines SET Doses = 0 WHERE Name = %s"
+        add_shard = "INSERT INTO VaccineShards VALUES (%s, %d, %d)"
+        with ConnectionManager() as conn:
+            cursor = conn.cursor(as_dict=True)
+            try:
+                cursor.execute(lock_shards, self.vaccine_name)
+                cursor.execute(fold_shards, (self.vaccine_name, self.vaccine_name))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    raise ValueError("No such vaccine!")
+                cursor.execute(drop_shards, self.vaccine_name)
+                if shards > 1:
+                    cursor.execute(get_doses, self.vaccine_name)
+                    doses = cursor.fetchone()["Doses"]
+                    cursor.execute(empty_vaccine, self.vaccine_name)
+                    cursor.executemany(add_shard, [(self.vaccine_name, i, doses // shards + (1 if i < doses % shards else 0))
+                                                   for i in range(shards)])
+                conn.commit()
+            except DatabaseError:
+                conn.rollback()
+                print("Error occurred when sharding vaccine doses")
 
     def __str__(self):
         return f"(Vaccine Name: {self.vaccine_name}, Available Doses: {self.available_doses})"
@@ -0,0 +1,114 @@
+import bisect
+import threading
+import time
+from util.Util import Util
+
+
+class AvailabilityCalendar:
+    """
+    An in-memory copy of the Availabilities table, holding the caregivers available on each day as one bitset:
+    every caregiver is given a bit the first time they are seen, and a day is a Python int with their bits set.
+    Counting the caregivers of a day is a popcount of its bitset (bin().count, as int.bit_count needs Python 3.10),
+    and the days with any caregiver are kept sorted, so range counts and next-free-day searches are a bisect
+    plus a walk over the days that have availability.
+    The calendar is read from the database by loader() on first use and again every ttl seconds, to pick up
+    the writes of other processes; in between, the commands of this process keep it current with add() and remove().
+    --------
+    Parameters:
+    loader: a function returning every (date, caregiver username) row of Availabilities
+    ttl: seconds the calendar is served before it is read from the database again
+    """
+
+    def __init__(self, loader, ttl=60):
+        self.loader = loader
+        self.ttl = ttl
+        self.bits = {}
+        self.names = []
+        self.days = {}
+        # the days with at least one caregiver, in date order
+        self.sorted_days = []
+        self.expires = None
+        self.lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        # called with the lock held; updates wait for the load, so none is lost to a load that started before it
+        if self.expires is not None and self.expires >= time.monotonic():
+            return
+        bits, names, days = {}, [], {}
+        for d, caregiver in self.loader():
+            bit = bits.get(caregiver)
+            if bit is None:
+                bit = bits[caregiver] = 1 << len(names)
+                names.append(caregiver)
+            d = Util.to_date(d)
+            days[d] = days.get(d, 0) | bit
+        self.bits, self.names, self.days = bits, names, days
+        self.sorted_days = sorted(days)
+        self.expires = time.monotonic() + self.ttl
+
+    def _bit(self, caregiver):
+        bit = self.bits.get(caregiver)
+        if bit is None:
+            bit = self.bits[caregiver] = 1 << len(self.names)
+            self.names.append(caregiver)
+        return bit
+
+    def add(self, d, caregiver):
+        """Mark the caregiver available on the given date."""
+        d = Util.to_date(d)
+        with self.lock:
+            if self.expires is None:
+                return
+            day = self.days.get(d, 0)
+            if day == 0:
+                bisect.insort(self.sorted_days, d)
+            self.days[d] = day | self._bit(caregiver)
+
+    def remove(self, d, caregiver):
+        """Mark the caregiver unavailable on the given date."""
+        d = Util.to_date(d)
+        with self.lock:
+            bit = self.bits.get(caregiver)
+            if self.expires is None or bit is None or d not in self.days:
+                return
+            day = self.days[d] & ~bit
+            if day == 0:
+                del self.days[d]
+                del self.sorted_days[bisect.bisect_left(self.sorted_days, d)]
+            else:
+                self.days[d] = day
+
+    def invalidate(self):
+        """Drop the calendar, so that it is read from the database again on next use."""
+        with self.lock:
+            self.expires = None
+
+    def caregivers(self, d):
+        """Return the usernames of the caregivers available on the given date."""
+        with self.lock:
+            self._ensure_loaded()
+            day = self.days.get(Util.to_date(d), 0)
+            names = []
+            while day:
+                low = day & -day
+                names.append(self.names[low.bit_length() - 1])
+                day ^= low
+            return names
+
+    def counts(self, start, end):
+        """Return (date, number of caregivers) for every day between start and end, both included, with any."""
+        with self.lock:
+            self._ensure_loaded()
+            first = bisect.bisect_left(self.sorted_days, Util.to_date(start))
+            last = bisect.bisect_right(self.sorted_days, Util.to_date(end))
+            return [(d, bin(self.days[d]).count("1")) for d in self.sorted_days[first:last]]
+
+    def next_day(self, from_date, skip=()):
+        """Return the earliest date on or after from_date with an available caregiver and not in skip, or None."""
+        skip = {Util.to_date(d) for d in skip}
+        with self.lock:
+            self._ensure_loaded()
+            for i in range(bisect.bisect_left(self.sorted_days, Util.to_date(from_date)), len(self.sorted_days)):
+                if self.sorted_days[i] not in skip:
+                    return self.sorted_days[i]
+            return None
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Cache:
+    """
+    A thread-safe in-process cache with a time-to-live and least-recently-used eviction.
+    --------
+    Parameters:
+    max_size: the number of entries kept before the least recently used one is evicted
+    ttl: seconds an entry is served before it is loaded again
+    """
+
+    def __init__(self, max_size=256, ttl=30):
+        if max_size <= 0:
+            raise ValueError("Cache size must be positive!")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # bumped by every invalidation, so a load that raced with a write is not cached
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss; a None result is not cached."""
+        value = self.get(key)
+        if value is None:
+            generation = self.generation
+            value = loader()
+            if value is not None and generation == self.generation:
+                self.put(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
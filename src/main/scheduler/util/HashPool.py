@@ -0,0 +1,57 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from util.Util import Util
+
+
+class HashPool:
+    """
+    Runs the PBKDF2 password hashing of Util.generate_hash on a shared worker pool instead of the calling thread.
+    HashExecutor selects a "thread" pool (the default; hashlib releases the GIL while hashing) or a "process" pool,
+    and HashWorkers its size (the number of CPUs by default).
+    """
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    kind = os.getenv("HashExecutor", "thread").lower()
+                    workers = int(os.getenv("HashWorkers", str(os.cpu_count() or 1)))
+                    if kind == "process":
+                        cls._executor = ProcessPoolExecutor(max_workers=workers)
+                    elif kind == "thread":
+                        cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+                    else:
+                        raise ValueError("Unknown hash executor: " + kind)
+        return cls._executor
+
+    @classmethod
+    def submit(cls, password, salt):
+        """Start hashing in the background and return a concurrent.futures.Future of the hash."""
+        return cls.get_executor().submit(Util.generate_hash, password, salt)
+
+    @classmethod
+    def generate_hash(cls, password, salt):
+        """Hash on the worker pool and wait for the result."""
+        return cls.submit(password, salt).result()
+
+    @classmethod
+    async def generate_hash_async(cls, password, salt):
+        """Hash on the worker pool without blocking the running event loop."""
+        return await asyncio.wrap_future(cls.submit(password, salt))
+
+    @classmethod
+    def map(cls, passwords, salts):
+        """Hash many passwords across the workers, returning the hashes in order."""
+        return list(cls.get_executor().map(Util.generate_hash, passwords, salts))
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown()
+                cls._executor = None
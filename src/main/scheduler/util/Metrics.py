@@ -0,0 +1,162 @@
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the scheduler command running in the current context, which database metrics are labelled with
+current_command = contextvars.ContextVar("current_command", default="none")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # one count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics:
+    """
+    Counters, latency histograms and gauges of one process, keyed by a name and a tuple of (label, value) pairs.
+    Snapshots come as a JSON-ready dictionary or in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name, labels=None, value=1):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, callback, labels=None):
+        """Report the value callback() returns at snapshot time as a gauge."""
+        with self.lock:
+            self.gauges[self._key(name, labels)] = callback
+
+    def get_counter(self, name, labels=None):
+        return self.counters.get(self._key(name, labels), 0)
+
+    @contextmanager
+    def command(self, name):
+        """Time a scheduler command and label the database work done during the with-block with its name."""
+        reset_token = current_command.set(name)
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as err:
+            self.inc("scheduler_command_errors_total", {"command": name, "error": type(err).__name__})
+            raise
+        finally:
+            self.observe("scheduler_command_seconds", time.perf_counter() - started, {"command": name})
+            current_command.reset(reset_token)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Return every metric as a JSON-ready dictionary."""
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [(key, histogram.count, histogram.sum, list(histogram.cumulative()))
+                          for key, histogram in self.histograms.items()]
+            gauges = list(self.gauges.items())
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+            "histograms": [{"name": name, "labels": dict(labels), "count": count, "sum": total,
+                            "buckets": {str(bound): n for bound, n in buckets}}
+                           for (name, labels), count, total, buckets in histograms],
+            "gauges": [{"name": name, "labels": dict(labels), "value": callback()}
+                       for (name, labels), callback in gauges],
+        }
+
+    def to_prometheus(self):
+        """Return every metric in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for kind, entries in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            for entry in sorted(entries, key=lambda e: (e["name"], sorted(e["labels"].items()))):
+                if entry["name"] not in typed:
+                    lines.append(f"# TYPE {entry['name']} {kind}")
+                    typed.add(entry["name"])
+                lines.append(f"{entry['name']}{_labels(entry['labels'])} {entry['value']}")
+        for entry in sorted(snapshot["histograms"], key=lambda e: (e["name"], sorted(e["labels"].items()))):
+            name = entry["name"]
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in entry["buckets"].items():
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f"{name}_bucket{_labels(dict(entry['labels'], le=le))} {count}")
+            lines.append(f"{name}_sum{_labels(entry['labels'])} {entry['sum']}")
+            lines.append(f"{name}_count{_labels(entry['labels'])} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write a snapshot to path, as JSON if it ends in .json and as Prometheus text otherwise."""
+        text = json.dumps(self.snapshot()) if path.endswith(".json") else self.to_prometheus()
+        # write to a temporary file first, so a scraper never reads half a snapshot
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    def export_to_file(self, path, interval):
+        """Rewrite the snapshot file every interval seconds in the background, and once more at exit."""
+        def export():
+            while True:
+                time.sleep(interval)
+                self.write(path)
+
+        threading.Thread(target=export, name="metrics-export", daemon=True).start()
+        atexit.register(self.write, path)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f"{name}=\"{value}\"" for name, value in zip(labels.keys(), escaped)) + "}"
+
+
+# the metrics of this process; MetricsFile names a file the snapshot is kept in, refreshed every MetricsInterval seconds
+metrics = Metrics()
+if os.getenv("MetricsFile"):
+    metrics.export_to_file(os.getenv("MetricsFile"), float(os.getenv("MetricsInterval", "15")))
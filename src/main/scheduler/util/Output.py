@@ -0,0 +1,53 @@
+import contextvars
+import io
+import sys
+from contextlib import contextmanager
+
+# where print() output of the current context goes; None means the real stdout
+output_buffer = contextvars.ContextVar("output_buffer", default=None)
+
+
+class ContextStdout:
+    """
+    Stands in for sys.stdout and sends whatever a command prints to the buffer of the context running it,
+    so commands of different clients can print at the same time without their output mixing.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = output_buffer.get()
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        buffer = output_buffer.get()
+        (buffer if buffer is not None else self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def install():
+    """Route sys.stdout through a ContextStdout, once per process."""
+    if not isinstance(sys.stdout, ContextStdout):
+        sys.stdout = ContextStdout(sys.stdout)
+
+
+@contextmanager
+def capture():
+    """
+    Collect what is printed in the current context during a with-block.
+    --------
+    Returns:
+    lines: a list, filled with the printed lines once the block exits
+    """
+    install()
+    buffer = io.StringIO()
+    lines = []
+    reset_token = output_buffer.set(buffer)
+    try:
+        yield lines
+    finally:
+        output_buffer.reset(reset_token)
+        lines.extend(line.strip() for line in buffer.getvalue().splitlines() if line.strip())
@@ -0,0 +1,50 @@
+import datetime
+
+WEEKDAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+PATTERNS = {
+    "daily": set(range(7)),
+    "weekdays": set(range(5)),
+    "weekends": {5, 6},
+}
+
+# the longest range one command may publish, so a typo in the year cannot insert decades of rows
+MAX_DAYS = 366
+
+
+class Recurrence:
+    """
+    The dates between two days (both included) that fall on a set of weekdays.
+    A pattern is "daily", "weekdays", "weekends" or a comma separated list of days such as "mon,wed,fri".
+    """
+
+    def __init__(self, start, end, pattern):
+        if end < start:
+            raise ValueError("The end date is before the start date!")
+        if (end - start).days >= MAX_DAYS:
+            raise ValueError("A range can cover at most " + str(MAX_DAYS) + " days!")
+        self.start = start
+        self.end = end
+        self.weekdays = Recurrence.parse_pattern(pattern)
+
+    @staticmethod
+    def parse_pattern(pattern):
+        pattern = pattern.lower()
+        if pattern in PATTERNS:
+            return PATTERNS[pattern]
+        weekdays = set()
+        for name in pattern.split(","):
+            if name not in WEEKDAY_NAMES:
+                raise ValueError("Unknown day: " + name)
+            weekdays.add(WEEKDAY_NAMES.index(name))
+        return weekdays
+
+    def dates(self):
+        """Return the matching dates in order."""
+        result = []
+        d = self.start
+        while d <= self.end:
+            if d.weekday() in self.weekdays:
+                result.append(d)
+            d += datetime.timedelta(days=1)
+        return result
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class Session:
+    def __init__(self, role, username, expires_at):
+        self.role = role
+        self.username = username
+        self.expires_at = expires_at
+
+    def get_role(self):
+        return self.role
+
+    def get_username(self):
+        return self.username
+
+    def is_expired(self, now=None):
+        return (now if now is not None else time.time()) >= self.expires_at
+
+
+class SessionStore:
+    """
+    Opaque, expiring session tokens issued after one verified password login.
+    Resuming a session is a dictionary lookup instead of a PBKDF2 hash and a database round trip. Lookups go by the
+    SHA-256 digest of the token, so their timing reveals nothing about which tokens exist.
+    Only the digests are kept, in memory and in the optional file, so a leaked file does not leak usable tokens.
+    The file is a journal of JSON lines: issue() and revoke() append one line each, and expired or evicted sessions
+    are simply dropped when it is read back. It is rewritten compactly on load and once it holds more than twice
+    as many lines as live sessions, plus 1000 so a small store is not rewritten every few logins, so a login never
+    waits on writing out every other session.
+    --------
+    Parameters:
+    max_size: the number of live sessions kept; the oldest one is dropped when a new one would exceed it
+    ttl: seconds a token stays valid after it is issued
+    path: optional file the sessions are persisted to, so tokens survive a restart
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, path=None):
+        if max_size <= 0:
+            raise ValueError("Session store size must be positive!")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        # lines in the journal file, live or not, which decides when it is compacted
+        self.journal_lines = 0
+        self.journal = None
+        if path is not None:
+            self._load()
+            self._compact()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def issue(self, role, username):
+        """Create a session for a user whose password was just verified, returning its token."""
+        # hex tokens survive the prompt lower-casing every command
+        token = secrets.token_hex(32)
+        with self.lock:
+            self._purge_expired()
+            self.sessions[self._digest(token)] = Session(role, username, time.time() + self.ttl)
+            while len(self.sessions) > self.max_size:
+                self.sessions.popitem(last=False)
+            self._append(["issue", self._digest(token), role, username, self.sessions[self._digest(token)].expires_at])
+        return token
+
+    def resolve(self, token):
+        """Return the live Session of token, or None if it is unknown, revoked or expired."""
+        digest = self._digest(token)
+        with self.lock:
+            session = self.sessions.get(digest)
+            if session is None:
+                return None
+            if session.is_expired():
+                # an expired session is skipped when the journal is read back, so it needs no line of its own
+                del self.sessions[digest]
+                return None
+            return session
+
+    def revoke(self, token):
+        digest = self._digest(token)
+        with self.lock:
+            if self.sessions.pop(digest, None) is not None:
+                self._append(["revoke", digest])
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _purge_expired(self):
+        # sessions are kept in the order they were issued, all with the same ttl, so the expired ones come first
+        now = time.time()
+        while len(self.sessions) > 0 and next(iter(self.sessions.values())).is_expired(now):
+            self.sessions.popitem(last=False)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # e.g. the last line of a journal cut short by a crash
+                continue
+            if entry[0] == "issue":
+                self.sessions[entry[1]] = Session(entry[2], entry[3], entry[4])
+            elif entry[0] == "revoke":
+                self.sessions.pop(entry[1], None)
+        self._purge_expired()
+        while len(self.sessions) > self.max_size:
+            self.sessions.popitem(last=False)
+
+    def _append(self, entry):
+        # called with the lock held; one short line per change instead of the whole store
+        if self.path is None:
+            return
+        self.journal.write(json.dumps(entry) + "\n")
+        self.journal.flush()
+        self.journal_lines += 1
+        if self.journal_lines > 2 * len(self.sessions) + 1000:
+            self._purge_expired()
+            self._compact()
+
+    def _compact(self):
+        # rewrite the journal as one line per live session; write to a temporary file first so a crash never
+        # leaves half a file behind
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            for digest, s in self.sessions.items():
+                f.write(json.dumps(["issue", digest, s.role, s.username, s.expires_at]) + "\n")
+        os.replace(temp_path, self.path)
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.path, "a")
+        self.journal_lines = len(self.sessions)
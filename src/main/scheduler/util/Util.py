@@ -1,3 +1,4 @@
+import datetime
 import hashlib
 import os
 
@@ -15,3 +16,7 @@ class Util:
             dklen=16
         )
         return key
+
+    def to_date(value):
+        # dates come back from the drivers as date, and go in as datetime at midnight
+        return value.date() if isinstance(value, datetime.datetime) else value